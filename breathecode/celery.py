@@ -2,13 +2,32 @@ from __future__ import absolute_import, unicode_literals
 
 import os
 import ssl
+import importlib
+import logging
 from celery import Celery
-from celery.signals import task_failure
+from celery.signals import task_failure, worker_init
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'breathecode.settings')
 REDIS_URL = os.getenv('REDIS_URL', '')
 
+logger = logging.getLogger(__name__)
+
+# heavy modules that are imported once by the worker parent process, the pool processes are
+# forked from it with them already loaded, the pool processes are only recycled when they
+# reach the --max-memory-per-child threshold of the Procfile
+PRELOAD_MODULES = [
+    'pandas',
+    'pyarrow',
+    'pyarrow.parquet',
+    'psycopg2',
+    'google.cloud.bigquery',
+    'google.cloud.bigquery_storage',
+    'google.cloud.storage',
+    'breathecode.services.google_cloud.bigquery',
+    'breathecode.services.google_cloud.storage',
+]
+
 # fix ssl error
 kwargs = {} if REDIS_URL.startswith('redis://') else {
     'broker_use_ssl': {
@@ -35,6 +54,15 @@ app.conf.update(BROKER_URL=REDIS_URL,
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
+
+@worker_init.connect
+def preload_modules(**kwargs):
+    for module in PRELOAD_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            logger.warning(f'Module {module} could not be preloaded: {str(e)}')
+
 if bool(os.environ.get('CELERY_WORKER_RUNNING', False)) and REDIS_URL:
     from django.conf import settings
     import rollbar
@@ -1,13 +1,14 @@
-import re
+import re, json
+from django_redis import get_redis_connection
 from github import Github, GithubException
 from slugify import slugify
 from django.utils import timezone
 from breathecode.authenticate.models import CredentialsGithub
 from google.cloud.exceptions import NotFound
-from breathecode.services.google_cloud.bigquery import BigQuery
 from .models import PipelineExecution, Pipeline, Project, Transformation, DataSource
 from .utils import PipelineException, HerokuDB, RemoteCSV
-from .tasks import async_run_transformation
+from .tasks import (async_run_transformation, async_flush_stream, async_resume_execution,
+                    clear_transformations_cache)
 
 
 def get_url_info(url: str):
@@ -133,5 +134,123 @@ def pull_project_from_github(project):
             transObject.code = python_code.content
             transObject.last_sync_at = timezone.now()
             transObject.save()
+
+    depends_on = {p['slug']: p.get('depends_on', []) for p in config['pipelines']}
+
+    def find_cycle(slug, visited):
+        if slug in visited:
+            raise Exception(f"Pipeline dependencies have a cycle: {' -> '.join(visited + [slug])}")
+        for upstream in depends_on.get(slug, []):
+            find_cycle(upstream, visited + [slug])
+
+    for slug in depends_on:
+        find_cycle(slug, [])
+
+    # the upstream pipelines can be declared after the pipelines that depend on them
+    for pipeline in config['pipelines']:
+        pipelineObject = Pipeline.objects.filter(slug=pipeline['slug'], project__slug=project.slug).first()
+        pipelineObject.upstream.clear()
+        for slug in pipeline.get('depends_on', []):
+            upstream = Pipeline.objects.filter(slug=slug, project__slug=project.slug).first()
+            if upstream is None:
+                raise Exception(f"Pipeline {pipeline['slug']} depends on pipeline {slug} that is not on the YML")
+
+            pipelineObject.upstream.add(upstream)
+
+    clear_transformations_cache(
+        Transformation.objects.filter(pipeline__project__id=project.id).values_list('id', flat=True))
+
     project.last_pull = timezone.now()
     project.save()
+
+
+def stream_events_key(pipeline):
+    return f'dataflow:stream:{pipeline.id}'
+
+
+def stream_flush_key(pipeline):
+    return f'dataflow:stream:{pipeline.id}:flush'
+
+
+def push_stream_event(pipeline, payload):
+    """
+    Add an incoming event to the pipeline micro-batch, the batch is flushed when it gets
+    stream_batch_size events or after stream_batch_wait_ms since its first event.
+    """
+    redis = get_redis_connection('default')
+    length = redis.rpush(stream_events_key(pipeline), json.dumps(payload))
+
+    # only the event that completes a batch enqueues its flush
+    if length % max(pipeline.stream_batch_size, 1) == 0:
+        async_flush_stream.delay(pipeline.id)
+
+    elif length == 1:
+        schedule_stream_flush(pipeline)
+
+    return length
+
+
+def schedule_stream_flush(pipeline):
+    """
+    Flush the micro-batch after stream_batch_wait_ms, unless there is already a flush waiting,
+    the flush clears the flag when it runs and it expires in case the flush is lost.
+    """
+    redis = get_redis_connection('default')
+    countdown = pipeline.stream_batch_wait_ms / 1000
+    if redis.set(stream_flush_key(pipeline), 1, nx=True, ex=int(countdown) + 60):
+        async_flush_stream.apply_async(args=(pipeline.id, ), countdown=countdown)
+
+
+def clear_stream_flush(pipeline):
+    redis = get_redis_connection('default')
+    redis.delete(stream_flush_key(pipeline))
+
+
+def pop_stream_events(pipeline):
+    redis = get_redis_connection('default')
+    key = stream_events_key(pipeline)
+
+    # lrange and ltrim run inside the same transaction
+    pipe = redis.pipeline()
+    pipe.lrange(key, 0, pipeline.stream_batch_size - 1)
+    pipe.ltrim(key, pipeline.stream_batch_size, -1)
+    events, _ = pipe.execute()
+
+    return [json.loads(x) for x in events]
+
+
+def count_stream_events(pipeline):
+    redis = get_redis_connection('default')
+    return redis.llen(stream_events_key(pipeline))
+
+
+def resume_execution(execution, transformation=None):
+    """
+    Resume a failed or aborted execution from the given transformation slug, or after the
+    last transformation that was saved into the buffer.
+    """
+    if execution.status not in ['CRITICAL', 'ABORTED']:
+        raise Exception(f'Execution {execution.id} is {execution.status}, only failed or aborted executions can resume')
+
+    if execution.incoming_stream is not None:
+        raise Exception('Stream executions cannot resume')
+
+    pipe = execution.pipeline.project.get_config(execution.pipeline.slug)
+    if transformation is not None:
+        if transformation not in pipe['transformations']:
+            raise Exception(f'Transformation {transformation} not found on pipeline {execution.pipeline.slug}')
+
+        index = pipe['transformations'].index(transformation)
+        completed = (execution.log or {}).get('completed', [])
+        if 'dag' not in pipe and index > 0 and pipe['transformations'][index - 1] not in completed:
+            raise Exception(
+                f'Transformation {pipe["transformations"][index - 1]} output was not saved into the buffer, resume from an earlier transformation'
+            )
+
+        if 'dag' in pipe:
+            completed = (execution.log or {}).get('dag', {}).get('completed', [])
+            missing = [i for i in pipe['dag'][transformation] if i not in pipe['sources'] and i not in completed]
+            if len(missing) > 0:
+                raise Exception(f'Transformation {transformation} inputs did not finish: {", ".join(missing)}')
+
+    async_resume_execution.delay(execution.id, transformation)
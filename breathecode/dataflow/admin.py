@@ -3,11 +3,11 @@ from django.contrib import admin
 from django import forms
 from breathecode.utils import getLogger
 from django.utils import timezone
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.contrib import messages
 from .models import Pipeline, Transformation, Project, DataSource, PipelineExecution
-from .actions import pull_project_from_github
-from .tasks import async_run_pipeline
+from .actions import pull_project_from_github, resume_execution
+from .tasks import async_run_pipeline, buffer_position
 from django.utils.html import format_html
 from .utils import PipelineException
 
@@ -25,7 +25,7 @@ def pull_github_project(modeladmin, request, queryset):
             messages.add_message(request, messages.ERROR, str(e))
 
 
-def download_sample_data(self, request, queryset, all=False):
+def download_sample_data(self, request, queryset, all=False, sample=None):
 
     sources = queryset.all()
     if sources.count() != 1:
@@ -35,17 +35,13 @@ def download_sample_data(self, request, queryset, all=False):
         return None
 
     source = sources[0]
-    driver = source.get_source()
-    df = driver.get_dataframe_from_table(source.table_name)
-    offset = 0
-    rows = 300
-
     if all:
-        offset = 0
-        rows = df.shape[0]
-    data = df.iloc[offset : offset + rows]
-    csv_data = data.to_csv(index=False)
-    response = HttpResponse(csv_data, content_type="text/csv")
+        # the source is read and sent in chunks, it never fits in memory at once
+        response = StreamingHttpResponse(source.iter_csv(), content_type="text/csv")
+    else:
+        df = source.get_sample_dataframe(rows=300, sample=sample)
+        response = HttpResponse(df.to_csv(index=False), content_type="text/csv")
+
     response["Content-Disposition"] = (
         'attachment; filename="' + str(source.slug) + '.csv"'
     )
@@ -58,7 +54,7 @@ class DataSourceForm(forms.ModelForm):
         super(DataSourceForm, self).__init__(*args, **kwargs)
         self.fields["source_type"] = forms.ChoiceField(
             choices=[
-                ("heroku", "Heroku"),
+                ("heroku", "Heroku / Postgres"),
                 ("bigquery", "BigQuery"),
                 ("csv", "CSV File on datastore"),
             ]
@@ -71,7 +67,12 @@ class DataSourceAdmin(admin.ModelAdmin):
     list_display = ("slug", "title","connection_string", "source_type", "table_name")
     # actions = [run_single_script]
     list_filter = ["title"]
-    actions = [download_sample_data, 'download_all_data']
+    actions = [download_sample_data, "download_random_sample", "download_all_data"]
+
+    def download_random_sample(self, request, queryset):
+        return download_sample_data(self, request, queryset, sample=1)
+
+    download_random_sample.short_description = "Download random sample (1% of the rows)"
 
     def download_all_data(self, request, queryset):
         return download_sample_data(self, request, queryset, all=True)
@@ -122,9 +123,10 @@ def remove_pause(modeladmin, request, queryset):
 @admin.register(Pipeline)
 class PipelineAdmin(admin.ModelAdmin):
     # form = CustomForm
-    list_display = ("slug", "sources", "source_to", "current_status")
+    list_display = ("slug", "sources", "source_to", "current_status", "metrics")
     actions = [execute_async, pause_for_one_day, pause_for_thirty_days, remove_pause]
     list_filter = ["status", "project__title"]
+    filter_horizontal = ("upstream",)
 
     # actions=[pull_github_project]
 
@@ -150,6 +152,9 @@ class PipelineAdmin(admin.ModelAdmin):
             [str(source.slug) + f" ({source.id})" for source in obj.source_from.all()]
         )
 
+    def metrics(self, obj):
+        return format_html(f"<a href='/v1/pipeline/{obj.slug}/metrics'>metrics</a>")
+
 
 @admin.register(Transformation)
 class TransformationAdmin(admin.ModelAdmin):
@@ -161,6 +166,7 @@ class TransformationAdmin(admin.ModelAdmin):
         "current_status",
         "pipeline",
         "last_run",
+        "peak_memory_mb",
         "last_sync_at",
         "script",
     )
@@ -192,11 +198,11 @@ def backup_buffer_to_gcp(modeladmin, request, queryset):
     executions = queryset.all()
     for e in executions:
         try:
-            position = e.pipeline.transformation_set.filter(
-                status="OPERATIONAL"
-            ).count()
-            if position > 0:
-                e.backup_buffer(position - 1)
+            # output of the last transformation saved into the buffer
+            completed = (e.log or {}).get("completed", [])
+            if len(completed) > 0:
+                pipe = e.pipeline.project.get_config(e.pipeline.slug)
+                e.backup_buffer(buffer_position(pipe, completed[-1]))
         except Exception as e:
             logger.exception(e)
 
@@ -205,12 +211,21 @@ def abort_execution(modeladmin, request, queryset):
     queryset.update(status="ABORTED")
 
 
+def resume_from_last_checkpoint(modeladmin, request, queryset):
+    for execution in queryset.all():
+        try:
+            resume_execution(execution)
+        except Exception as e:
+            messages.error(request, f"Execution {execution.id}: {str(e)}")
+
+
 @admin.register(PipelineExecution)
 class PipelineExecutionAdmin(admin.ModelAdmin):
     # form = CustomForm
-    list_display = ("id", "pipeline", "current_status", "started_at", "buffer")
+    list_display = ("id", "pipeline", "current_status", "started_at", "peak_memory_mb", "buffer")
     list_filter = ["status", "pipeline__slug", "pipeline__project__slug"]
-    actions = [backup_buffer_to_gcp, abort_execution]
+    actions = [backup_buffer_to_gcp, abort_execution, resume_from_last_checkpoint]
+    readonly_fields = ["step_metrics"]
 
     def current_status(self, obj):
         colors = {
@@ -227,5 +242,30 @@ class PipelineExecutionAdmin(admin.ModelAdmin):
 
     def buffer(self, obj):
         return format_html(
-            f"<a href='/v1/execution/{obj.id}/buffer?position=0&rows=500&offset=0'>download buffer</span>"
+            f"<a href='/v1/execution/{obj.id}/buffer?rows=500&offset=0'>download buffer</a>"
+        )
+
+    def step_metrics(self, obj):
+        steps = (obj.log or {}).get("steps", [])
+        if len(steps) == 0:
+            return "No metrics"
+
+        columns = [
+            "transformation",
+            "status",
+            "read_seconds",
+            "run_seconds",
+            "write_seconds",
+            "input_rows",
+            "output_rows",
+            "output_bytes",
+            "peak_memory_mb",
+        ]
+        header = "".join([f"<th>{c}</th>" for c in columns])
+        rows = "".join(
+            [
+                "<tr>" + "".join([f"<td>{step.get(c, '')}</td>" for c in columns]) + "</tr>"
+                for step in steps
+            ]
         )
+        return format_html(f"<table><tr>{header}</tr>{rows}</table>")
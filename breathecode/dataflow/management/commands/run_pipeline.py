@@ -23,9 +23,11 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         now = timezone.now()
+        # pipelines with upstream dependencies are triggered when those finish
         pipelines = Pipeline.objects \
                 .filter(Q(started_at__isnull=True) | Q(started_at__lte=now - F('frequency_delta_minutes'))) \
-                .exclude(paused_until__isnull=False, paused_until__gte=now).values_list('slug', 'project__slug')
+                .exclude(paused_until__isnull=False, paused_until__gte=now) \
+                .filter(upstream__isnull=True).values_list('slug', 'project__slug')
 
         for slug, project_slug in pipelines:
                 async_run_pipeline.delay(slug, project_slug)
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataflow', '0010_alter_project_last_pull'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pipeline',
+            name='buffer_format',
+            field=models.CharField(choices=[('parquet', 'Parquet'), ('arrow', 'Arrow IPC'), ('csv', 'CSV')], default='parquet', help_text='File format used for the intermediate buffers between transformations, parquet and arrow keep the column types', max_length=20),
+        ),
+    ]
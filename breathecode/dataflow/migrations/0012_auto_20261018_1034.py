@@ -0,0 +1,23 @@
+# Generated by Django 3.2.16 on 2026-10-18 10:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataflow', '0011_pipeline_buffer_format'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pipeline',
+            name='checkpoint',
+            field=models.CharField(choices=[('EVERY_STEP', 'Every step'), ('LAST_STEP', 'Last step or failure')], default='LAST_STEP', help_text='When to save the transformation output into the buffer, only used when running in process', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='pipeline',
+            name='execution_mode',
+            field=models.CharField(choices=[('DISTRIBUTED', 'Transformations on their own task'), ('IN_PROCESS', 'Sources and transformations in one task')], default='DISTRIBUTED', help_text='Distributed runs the transformations on a separate task that saves every step into the buffer, in process runs them on the same task that read the sources passing the dataframes in memory', max_length=20),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.16 on 2026-10-18 11:02
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataflow', '0012_auto_20261018_1034'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasource',
+            name='snapshot_ttl',
+            field=models.DurationField(default=datetime.timedelta(seconds=1800), help_text='How long a downloaded copy of this source can be reused by other pipelines and as lookup context by streams'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.16 on 2026-10-18 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataflow', '0013_datasource_snapshot_ttl'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pipeline',
+            name='stream_batch_size',
+            field=models.PositiveIntegerField(default=1, help_text='Max amount of incoming stream events that will be processed together, 1 will process every event as soon as it arrives'),
+        ),
+        migrations.AddField(
+            model_name='pipeline',
+            name='stream_batch_wait_ms',
+            field=models.PositiveIntegerField(default=1000, help_text='Max time in milliseconds that an incoming stream event will wait for its batch to be full'),
+        ),
+        migrations.AddField(
+            model_name='pipelineexecution',
+            name='stream_batch',
+            field=models.BooleanField(default=False, help_text='The incoming stream is a list of events accumulated by the pipeline micro-batch'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataflow', '0014_auto_20261018_1125'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasource',
+            name='chunk_size',
+            field=models.PositiveIntegerField(blank=True, default=None, help_text='Read the source in chunks of this amount of rows to keep the memory bounded, only for Heroku. Empty to read everything at once.', null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataflow', '0015_datasource_chunk_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasource',
+            name='watermark_column',
+            field=models.CharField(blank=True, default=None, help_text='If set, pipelines will only fetch the rows with a value greater than the last one they read (e.g: updated_at or a serial id) and append them to the destination', max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='pipeline',
+            name='watermarks',
+            field=models.JSONField(blank=True, default=None, help_text='Last watermark value read from each incremental source, by source slug', null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataflow', '0016_auto_20261018_1207'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasource',
+            name='primary_key',
+            field=models.CharField(blank=True, default=None, help_text='Comma separated list of columns that identify each row, needed to merge into this datasource', max_length=250, null=True),
+        ),
+        migrations.AddField(
+            model_name='pipeline',
+            name='merge_destination_table',
+            field=models.BooleanField(default=False, help_text='Will update the rows of the destination with the same primary key and insert the new ones, instead of replacing or appending'),
+        ),
+    ]
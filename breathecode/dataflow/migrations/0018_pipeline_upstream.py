@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataflow', '0017_auto_20261018_1231'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pipeline',
+            name='upstream',
+            field=models.ManyToManyField(blank=True, help_text='Pipelines that need to finish before this one runs, it will be triggered when all of them are done instead of following its frequency', related_name='downstream', to='dataflow.Pipeline'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.16 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataflow', '0018_pipeline_upstream'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pipeline',
+            name='memory_limit_mb',
+            field=models.PositiveIntegerField(blank=True, default=None, help_text='Max memory (RSS) in MB a transformation can add to the worker, the transformation fails as CRITICAL when it goes over it', null=True),
+        ),
+        migrations.AddField(
+            model_name='pipelineexecution',
+            name='peak_memory_mb',
+            field=models.FloatField(blank=True, default=None, help_text='Peak memory (RSS) in MB of the worker while running the transformations', null=True),
+        ),
+        migrations.AddField(
+            model_name='transformation',
+            name='peak_memory_mb',
+            field=models.FloatField(blank=True, default=None, help_text='Peak memory (RSS) in MB of the worker on the last run', null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.16 on 2026-10-18 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataflow', '0019_auto_20261018_1402'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pipeline',
+            name='cache_outputs',
+            field=models.BooleanField(default=False, help_text='Reuse the last output of a transformation when its code and inputs did not change, and skip the destination write when the output did not change. Only for transformations that do not depend on the current time or external services'),
+        ),
+        migrations.AddField(
+            model_name='pipeline',
+            name='last_output_hash',
+            field=models.CharField(blank=True, default=None, help_text='Hash of the last output saved into the destination, used when cache_outputs is enabled', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='transformation',
+            name='cache_key',
+            field=models.CharField(blank=True, default=None, help_text='Hash of the code and inputs of the output that is kept on the cache', max_length=64, null=True),
+        ),
+    ]
@@ -1,11 +1,25 @@
-import base64, yaml, os, traceback
+import base64, yaml, os, traceback, time, json, hashlib, shutil, threading
 import pandas as pd
-from django.db import models
+from django.db import models, connection
+from django.core.cache import cache
 from django.contrib.auth.models import User
 from github import Github, GithubException
 from datetime import timedelta
-from .utils import HerokuDB, RemoteCSV
-from breathecode.services.google_cloud.bigquery import BigQuery
+from .utils import (
+    HerokuDB,
+    RemoteCSV,
+    BUFFER_FORMATS,
+    BUFFER_EXTENSIONS,
+    BACKUP_EXTENSIONS,
+    PARQUET,
+    read_buffer,
+    write_buffer,
+    write_buffer_chunks,
+    file_hash,
+    compress_buffer,
+    decompress_buffer,
+    iter_buffer_csv,
+)
 
 LOADING = "LOADING"
 OPERATIONAL = "OPERATIONAL"
@@ -18,6 +32,52 @@ STATUS = (
     (CRITICAL, "Critical"),
 )
 
+DISTRIBUTED = "DISTRIBUTED"
+IN_PROCESS = "IN_PROCESS"
+EXECUTION_MODES = (
+    (DISTRIBUTED, "Transformations on their own task"),
+    (IN_PROCESS, "Sources and transformations in one task"),
+)
+
+EVERY_STEP = "EVERY_STEP"
+LAST_STEP = "LAST_STEP"
+CHECKPOINTS = (
+    (EVERY_STEP, "Every step"),
+    (LAST_STEP, "Last step or failure"),
+)
+
+
+def get_dag(sources, transformations, inputs):
+    """
+    Validate the inputs declared by the pipeline transformations and return the graph with
+    the inputs of every transformation, the ones that did not declare any inputs consume the
+    output of the previous transformation (or all the sources if they are the first one).
+    """
+    dag = {}
+    previous = None
+    for slug in transformations:
+        if slug in sources:
+            raise Exception(
+                f"Transformation {slug} cannot have the same slug than a pipeline source"
+            )
+
+        dag[slug] = inputs.get(slug, list(sources) if previous is None else [previous])
+        for i in dag[slug]:
+            if i not in sources and i not in dag:
+                raise Exception(
+                    f"Transformation {slug} input {i} must be a source or a previous transformation"
+                )
+        previous = slug
+
+    consumed = set(i for slugs in dag.values() for i in slugs)
+    outputs = [slug for slug in dag if slug not in consumed]
+    if len(outputs) != 1:
+        raise Exception(
+            f'Pipeline transformations must end on a single output, found {", ".join(outputs)}'
+        )
+
+    return dag
+
 
 class Project(models.Model):
     title = models.CharField(max_length=100)
@@ -43,7 +103,6 @@ class Project(models.Model):
 
         if not isinstance(self.config["pipelines"], list):
             raise Exception("Project pipelines property must be a list on the YML")
-        pipeline_index = 0
         for pipeline in self.config["pipelines"]:
             if not isinstance(pipeline, dict):
                 raise Exception(
@@ -62,12 +121,55 @@ class Project(models.Model):
                     "Project.pipelines[].transformations property must be a list on the YML"
                 )
 
-            count = len(self.config["pipelines"][pipeline_index]["transformations"])
-            for index in range(count):
-                self.config["pipelines"][pipeline_index]["transformations"][index] = (
-                    self.config["pipelines"][pipeline_index]["transformations"][
-                        index
-                    ].split(".")[0]
+            if not isinstance(pipeline["sources"], list):
+                raise Exception(
+                    "Project.pipelines[].sources property must be a list on the YML"
+                )
+
+            # sources can be a slug or a dictionary with the columns and filter to read
+            settings = pipeline.get("source_settings", {})
+            for index, source in enumerate(pipeline["sources"]):
+                if isinstance(source, str):
+                    continue
+                if not isinstance(source, dict) or "slug" not in source:
+                    raise Exception(
+                        "Project.pipelines[].sources must be a list of slugs or dictionaries with a slug on the YML"
+                    )
+                if "columns" in source and not isinstance(source["columns"], list):
+                    raise Exception(
+                        f'Source {source["slug"]} columns property must be a list on the YML'
+                    )
+
+                settings[source["slug"]] = {
+                    "columns": source.get("columns", None),
+                    "filter": source.get("filter", None),
+                }
+                pipeline["sources"][index] = source["slug"]
+            pipeline["source_settings"] = settings
+
+            # transformations can be a file name or a dictionary with the slug and
+            # the inputs it consumes (sources or previous transformations)
+            dag = pipeline.get("dag", {})
+            for index, t in enumerate(pipeline["transformations"]):
+                if isinstance(t, str):
+                    pipeline["transformations"][index] = t.split(".")[0]
+                    continue
+                if not isinstance(t, dict) or "slug" not in t:
+                    raise Exception(
+                        "Project.pipelines[].transformations must be a list of file names or dictionaries with a slug on the YML"
+                    )
+                if not isinstance(t.get("inputs", None), list):
+                    raise Exception(
+                        f'Transformation {t["slug"]} inputs property must be a list on the YML'
+                    )
+
+                slug = t["slug"].split(".")[0]
+                dag[slug] = [i.split(".")[0] for i in t["inputs"]]
+                pipeline["transformations"][index] = slug
+
+            if len(dag) > 0:
+                pipeline["dag"] = get_dag(
+                    pipeline["sources"], pipeline["transformations"], dag
                 )
 
         if pipeline_slug is not None:
@@ -83,6 +185,21 @@ class Project(models.Model):
         self.config = yaml.safe_load(yml_content)
 
 
+# snapshots already loaded in memory by path, with the modification time of the file
+SNAPSHOTS = {}
+# snapshots that this worker is downloading again on the background, by path
+REFRESHING_SNAPSHOTS = set()
+# seconds until the lock of a snapshot download expires, the worker downloading it
+# refreshes the lock a few times per timeout so it only expires if the worker died
+SNAPSHOT_LOCK_TIMEOUT = 60
+# max seconds to wait for another worker downloading the same snapshot
+SNAPSHOT_WAIT_TIMEOUT = 60 * 60
+# rows read at a time when a whole source is downloaded from the admin
+DOWNLOAD_CHUNK_SIZE = 50000
+# the backups are uploaded in chunks of 8MB (multiple of 256KB) that can be retried
+BACKUP_CHUNK_SIZE = 8 * 1024 * 1024
+
+
 class DataSource(models.Model):
     slug = models.SlugField(null=True, default=None)
     title = models.CharField(max_length=100)
@@ -108,12 +225,234 @@ class DataSource(models.Model):
         default=None,
         help_text="Ignored if Google BigQuery. File path if CSV.",
     )
+    chunk_size = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        default=None,
+        help_text="Read the source in chunks of this amount of rows to keep the memory bounded, only for Heroku. Empty to read everything at once.",
+    )
+    primary_key = models.CharField(
+        max_length=250,
+        blank=True,
+        null=True,
+        default=None,
+        help_text="Comma separated list of columns that identify each row, needed to merge into this datasource",
+    )
+    watermark_column = models.CharField(
+        max_length=100,
+        blank=True,
+        null=True,
+        default=None,
+        help_text="If set, pipelines will only fetch the rows with a value greater than the last one they read (e.g: updated_at or a serial id) and append them to the destination",
+    )
+    snapshot_ttl = models.DurationField(
+        default=timedelta(minutes=30),
+        help_text="How long a downloaded copy of this source can be reused by other pipelines and as lookup context by streams",
+    )
 
     def __str__(self):
         return f"{self.title}: {self.source_type}.{self.table_name}"
 
+    def snapshot_url(self, key):
+        return f"./buffer/snapshot_{self.id}_{key}.parquet"
+
+    def snapshot_key(self, columns=None, where=None):
+        """Hash of the query, the same source can have one snapshot per query"""
+        query = json.dumps(
+            {"table": self.table_name, "columns": columns, "where": where},
+            sort_keys=True,
+        )
+        return hashlib.sha256(query.encode("utf-8")).hexdigest()[:16]
+
+    def read_chunks(self, FROM_DB, **kwargs):
+        """
+        Returns an iterator with the chunks of the source if it can be read in chunks
+        (record batches or dataframes), None if it has to be read at once.
+        """
+        if hasattr(FROM_DB, "iter_record_batches"):
+            if "where" in kwargs:
+                kwargs["row_restriction"] = kwargs.pop("where")
+            return FROM_DB.iter_record_batches(self.table_name, **kwargs)
+
+        if self.chunk_size and hasattr(FROM_DB, "iter_dataframes_from_table"):
+            return FROM_DB.iter_dataframes_from_table(
+                self.table_name, chunk_size=self.chunk_size, **kwargs
+            )
+
+        return None
+
+    def get_snapshot(self, max_age=None, columns=None, where=None, stale=False):
+        """
+        Returns the path of a local parquet snapshot of the source that is not older than
+        max_age (snapshot_ttl by default), every pipeline or stream reading the same query
+        shares it. The metadata lives in the cache and only one worker downloads the
+        snapshot at a time, the others wait for it. With stale, an old local snapshot is
+        returned right away while it is downloaded again on the background.
+        """
+        if max_age is None:
+            max_age = self.snapshot_ttl
+
+        key = self.snapshot_key(columns, where)
+        path = self.snapshot_url(key)
+        meta_key = f"dataflow:snapshot:{self.id}:{key}"
+        lock_key = f"{meta_key}:lock"
+
+        deadline = time.time() + SNAPSHOT_WAIT_TIMEOUT
+        while True:
+            meta = cache.get(meta_key)
+            if (
+                meta is not None
+                and os.path.isfile(path)
+                and time.time() - meta["created_at"] <= max_age.total_seconds()
+            ):
+                print(f"Reusing snapshot of {self.slug} from {meta['created_at']}")
+                return path
+
+            if stale and os.path.isfile(path):
+                self.refresh_snapshot(max_age, columns, where)
+                print(f"Reusing stale snapshot of {self.slug} while it is downloaded again")
+                return path
+
+            if cache.add(lock_key, True, timeout=SNAPSHOT_LOCK_TIMEOUT):
+                break
+
+            if time.time() > deadline:
+                raise Exception(
+                    f"Timeout waiting for the snapshot of source {self.slug}"
+                )
+            time.sleep(1)
+
+        # the lock expires soon after this worker stops refreshing it (e.g: killed for OOM)
+        downloaded = threading.Event()
+
+        def refresh_lock():
+            while not downloaded.wait(SNAPSHOT_LOCK_TIMEOUT / 3):
+                cache.touch(lock_key, SNAPSHOT_LOCK_TIMEOUT)
+
+        threading.Thread(target=refresh_lock, daemon=True).start()
+
+        try:
+            if not os.path.exists("./buffer"):
+                raise Exception('Directory "buffer" does not exists')
+
+            kwargs = {}
+            if columns or where:
+                kwargs = {"columns": columns, "where": where}
+
+            FROM_DB = self.get_source()
+            try:
+                chunks = self.read_chunks(FROM_DB, **kwargs)
+                if chunks is not None:
+                    write_buffer_chunks(chunks, path + ".tmp", PARQUET)
+                else:
+                    df = FROM_DB.get_dataframe_from_table(self.table_name, **kwargs)
+                    write_buffer(df, path + ".tmp", PARQUET)
+                    del df
+            finally:
+                if hasattr(FROM_DB, "close"):
+                    FROM_DB.close()
+
+            os.replace(path + ".tmp", path)
+            cache.set(
+                meta_key,
+                {"created_at": time.time()},
+                timeout=self.snapshot_ttl.total_seconds(),
+            )
+            print(f"Snapshot of {self.slug} saved at {path}")
+            return path
+
+        finally:
+            downloaded.set()
+            cache.delete(lock_key)
+
+    def refresh_snapshot(self, max_age, columns=None, where=None):
+        """Download the snapshot again on a background thread of this worker, once at a time"""
+        path = self.snapshot_url(self.snapshot_key(columns, where))
+        if path in REFRESHING_SNAPSHOTS:
+            return
+        REFRESHING_SNAPSHOTS.add(path)
+
+        def refresh():
+            try:
+                self.get_snapshot(max_age, columns=columns, where=where)
+            except Exception:
+                print(f"Error downloading the snapshot of {self.slug} again")
+                traceback.print_exc()
+            finally:
+                REFRESHING_SNAPSHOTS.discard(path)
+                # the thread opens its own database connection
+                connection.close()
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get_snapshot_df(self, columns=None, where=None, stale=False):
+        """
+        Get the content of the source from a local snapshot, it will be downloaded
+        again only if the snapshot is older than snapshot_ttl.
+        """
+        path = self.get_snapshot(columns=columns, where=where, stale=stale)
+
+        mtime = os.path.getmtime(path)
+        cached = SNAPSHOTS.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, read_buffer(path, PARQUET))
+            SNAPSHOTS[path] = cached
+
+        # transformations could modify the dataframe in place
+        return cached[1].copy()
+
+    def get_sample_dataframe(self, rows=300, sample=None):
+        """
+        Preview of the first rows of the source (a random sample if sample is a percentage),
+        the drivers only read those rows instead of the whole table
+        """
+        FROM_DB = self.get_source()
+        try:
+            return FROM_DB.get_sample_dataframe(
+                self.table_name, rows=rows, sample=sample
+            )
+        finally:
+            if hasattr(FROM_DB, "close"):
+                FROM_DB.close()
+
+    def iter_csv(self, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """
+        Iterator with the whole source as csv text, read one chunk at a time so it can be
+        streamed without loading the source in memory
+        """
+        FROM_DB = self.get_source()
+        try:
+            if hasattr(FROM_DB, "iter_record_batches"):
+                chunks = FROM_DB.iter_record_batches(self.table_name)
+            else:
+                chunks = FROM_DB.iter_dataframes_from_table(
+                    self.table_name, chunk_size=self.chunk_size or chunk_size
+                )
+
+            header = True
+            for chunk in chunks:
+                if not isinstance(chunk, pd.DataFrame):
+                    chunk = chunk.to_pandas()
+                yield chunk.to_csv(index=False, header=header)
+                header = False
+        finally:
+            if hasattr(FROM_DB, "close"):
+                FROM_DB.close()
+
+    def get_primary_key(self):
+        if self.primary_key is None:
+            raise Exception(f"Datasource {self.slug} is missing its primary_key")
+
+        primary_key = [x.strip() for x in self.primary_key.split(",") if x.strip()]
+        if len(primary_key) == 0:
+            raise Exception(f"Datasource {self.slug} is missing its primary_key")
+
+        return primary_key
+
     def get_source(self):
         if self.source_type == "bigquery":
+            from breathecode.services.google_cloud.bigquery import BigQuery
+
             return BigQuery(dataset=self.database)
         if self.source_type == "heroku":
             return HerokuDB(connection_string=self.connection_string)
@@ -145,12 +484,67 @@ class Pipeline(models.Model):
         related_name="pipeline_to_set",
     )
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    upstream = models.ManyToManyField(
+        "self",
+        blank=True,
+        symmetrical=False,
+        related_name="downstream",
+        help_text="Pipelines that need to finish before this one runs, it will be triggered when all of them are done instead of following its frequency",
+    )
 
     status = models.CharField(max_length=20, choices=STATUS, default=OPERATIONAL)
     replace_destination_table = models.BooleanField(
         default=False,
         help_text="Will delete the table and create it again on every run",
     )
+    merge_destination_table = models.BooleanField(
+        default=False,
+        help_text="Will update the rows of the destination with the same primary key and insert the new ones, instead of replacing or appending",
+    )
+    buffer_format = models.CharField(
+        max_length=20,
+        choices=BUFFER_FORMATS,
+        default=PARQUET,
+        help_text="File format used for the intermediate buffers between transformations, parquet and arrow keep the column types",
+    )
+    execution_mode = models.CharField(
+        max_length=20,
+        choices=EXECUTION_MODES,
+        default=DISTRIBUTED,
+        help_text="Distributed runs the transformations on a separate task that saves every step into the buffer, in process runs them on the same task that read the sources passing the dataframes in memory",
+    )
+    checkpoint = models.CharField(
+        max_length=20,
+        choices=CHECKPOINTS,
+        default=LAST_STEP,
+        help_text="When to save the transformation output into the buffer, only used when running in process",
+    )
+    stream_batch_size = models.PositiveIntegerField(
+        default=1,
+        help_text="Max amount of incoming stream events that will be processed together, 1 will process every event as soon as it arrives",
+    )
+    stream_batch_wait_ms = models.PositiveIntegerField(
+        default=1000,
+        help_text="Max time in milliseconds that an incoming stream event will wait for its batch to be full",
+    )
+
+    cache_outputs = models.BooleanField(
+        default=False,
+        help_text="Reuse the last output of a transformation when its code and inputs did not change, and skip the destination write when the output did not change. Only for transformations that do not depend on the current time or external services",
+    )
+    last_output_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        null=True,
+        default=None,
+        help_text="Hash of the last output saved into the destination, used when cache_outputs is enabled",
+    )
+    memory_limit_mb = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        default=None,
+        help_text="Max memory (RSS) in MB a transformation can add to the worker, the transformation fails as CRITICAL when it goes over it",
+    )
 
     paused_until = models.DateTimeField(
         null=True,
@@ -162,6 +556,12 @@ class Pipeline(models.Model):
         default=timedelta(minutes=30),
         help_text="How long to wait for the next execution, defaults to 30 minutes",
     )
+    watermarks = models.JSONField(
+        blank=True,
+        null=True,
+        default=None,
+        help_text="Last watermark value read from each incremental source, by source slug",
+    )
     started_at = models.DateTimeField(null=True, blank=True, default=None)
     ended_at = models.DateTimeField(null=True, blank=True, default=None)
 
@@ -183,6 +583,39 @@ class Pipeline(models.Model):
 
         return self.source_to.table_name
 
+    def output_url(self):
+        """Last full output of the pipeline, shared with the downstream pipelines"""
+        extension = BUFFER_EXTENSIONS[self.buffer_format]
+        return f"./buffer/output_{self.id}_{self.slug}.{extension}"
+
+    def save_output_df(self, df):
+        if not os.path.exists("./buffer"):
+            raise Exception('Directory "buffer" does not exists')
+
+        # the downstream pipelines could be reading the previous output
+        path = self.output_url()
+        write_buffer(df, path + ".tmp", self.buffer_format)
+        os.replace(path + ".tmp", path)
+
+    def get_output_df(self):
+        """Returns None if the last execution did not leave a full output"""
+        if not os.path.isfile(self.output_url()):
+            return None
+        return read_buffer(self.output_url(), self.buffer_format)
+
+    def remove_output(self):
+        if os.path.isfile(self.output_url()):
+            os.remove(self.output_url())
+
+    def upstream_is_ready(self):
+        """All the upstream pipelines finished successfully after the last time this one started"""
+        for upstream in self.upstream.all():
+            if upstream.status != OPERATIONAL or upstream.ended_at is None:
+                return False
+            if self.started_at is not None and upstream.ended_at < self.started_at:
+                return False
+        return True
+
 
 PENDING = "PENDING"
 DONE = "DONE"
@@ -210,6 +643,16 @@ class PipelineExecution(models.Model):
         default=None,
         help_text="If set, the pipeline will be treated like a stream",
     )
+    stream_batch = models.BooleanField(
+        default=False,
+        help_text="The incoming stream is a list of events accumulated by the pipeline micro-batch",
+    )
+    peak_memory_mb = models.FloatField(
+        null=True,
+        blank=True,
+        default=None,
+        help_text="Peak memory (RSS) in MB of the worker while running the transformations",
+    )
 
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     updated_at = models.DateTimeField(auto_now=True, editable=False)
@@ -221,20 +664,55 @@ class PipelineExecution(models.Model):
         self.stdout += "\n".join(traceback.format_exception(None, e, e.__traceback__))
 
     def buffer_url(self, position=0):
+        extension = BUFFER_EXTENSIONS[self.pipeline.buffer_format]
         return (
-            "./buffer/" + str(self.id) + self.pipeline.slug + f"_buffer{position}.csv"
+            "./buffer/"
+            + str(self.id)
+            + self.pipeline.slug
+            + f"_buffer{position}.{extension}"
         )
 
     def get_buffer_df(self, position=0):
-        return pd.read_csv(self.buffer_url(position))
+        if not os.path.isfile(self.buffer_url(position)):
+            # the execution could have started on another worker
+            if not self.restore_buffer(position):
+                raise Exception("Execution buffer not found for position %s" % position)
+        return read_buffer(self.buffer_url(position), self.pipeline.buffer_format)
+
+    def save_buffer_chunks(self, chunks, position=0):
+        if not os.path.exists("./buffer"):
+            raise Exception('Directory "buffer" does not exists')
+        write_buffer_chunks(
+            chunks, self.buffer_url(position), self.pipeline.buffer_format
+        )
+        print("Buffer saved succesfully at position %s" % position)
+
+    def load_buffer_from(self, path, position=0):
+        """Use a parquet file (like a source snapshot) as the buffer"""
+        if not os.path.exists("./buffer"):
+            raise Exception('Directory "buffer" does not exists')
+        if self.pipeline.buffer_format == PARQUET:
+            shutil.copyfile(path, self.buffer_url(position))
+        else:
+            write_buffer(
+                read_buffer(path, PARQUET),
+                self.buffer_url(position),
+                self.pipeline.buffer_format,
+            )
+        print("Buffer saved succesfully at position %s" % position)
 
     def save_buffer_df(self, df, position=0):
         if not os.path.exists("./buffer"):
             raise Exception('Directory "buffer" does not exists')
-        result = df.to_csv(self.buffer_url(position), index=False)
+        write_buffer(df, self.buffer_url(position), self.pipeline.buffer_format)
         print("Buffer saved succesfully at position %s" % position)
 
     def backup_buffer(self, position=0):
+        """
+        Upload a compressed copy of the buffer as the checkpoint of the execution. When the
+        last backup of the pipeline has the same content (e.g: the output did not change
+        since the previous execution) it is copied inside the bucket instead of uploaded.
+        """
         from breathecode.services.google_cloud.storage import Storage
 
         storage = Storage()
@@ -247,26 +725,125 @@ class PipelineExecution(models.Model):
         if not os.path.exists("./buffer"):
             raise Exception('Directory "buffer" does not exists')
 
-        backup_path = f"buffer/{self.pipeline.slug}.csv"
-        print("Saving to ", bucket_name, backup_path)
+        content_hash = file_hash(buffer_url)
+
+        def same_content(file):
+            return (
+                file.blob is not None
+                and bool(file.blob.metadata)
+                and file.blob.metadata.get("sha256") == content_hash
+            )
+
+        checkpoint_path = self.checkpoint_path(position)
+        checkpoint = storage.file(bucket_name, checkpoint_path)
+        latest_path = self.latest_backup_path()
+        latest = storage.file(bucket_name, latest_path)
+
+        if same_content(checkpoint):
+            print(f"Backup {checkpoint_path} is up to date")
+        elif same_content(latest):
+            print(f"Copying {latest_path} into {checkpoint_path}, the content is the same")
+            latest.copy(checkpoint_path)
+        else:
+            print("Saving to ", bucket_name, checkpoint_path)
+            compressed = buffer_url + ".backup"
+            try:
+                compress_buffer(buffer_url, self.pipeline.buffer_format, compressed)
+                checkpoint.upload(
+                    from_filename=compressed,
+                    chunk_size=BACKUP_CHUNK_SIZE,
+                    metadata={"sha256": content_hash},
+                )
+            finally:
+                if os.path.isfile(compressed):
+                    os.remove(compressed)
+
+        if not same_content(latest):
+            checkpoint.copy(latest_path)
 
-        file = storage.file(bucket_name, backup_path)
-        print("Starting backup for ")
-        file.upload(from_filename=buffer_url)
         print("Backup saved successfully at position %s" % position)
         return True
 
-    def get_buffer_backup(self):
+    def checkpoint_path(self, position=0):
+        name = os.path.basename(self.buffer_url(position)).rsplit(".", 1)[0]
+        extension = BACKUP_EXTENSIONS[self.pipeline.buffer_format]
+        return f"buffer/executions/{self.id}/{name}.{extension}"
+
+    def latest_backup_path(self):
+        extension = BACKUP_EXTENSIONS[self.pipeline.buffer_format]
+        return f"buffer/{self.pipeline.slug}.{extension}"
+
+    def restore_buffer(self, position=0):
+        """
+        Download the checkpoint of the buffer from the bucket if it is not on this worker,
+        returns False if there is no checkpoint.
+        """
+        from breathecode.services.google_cloud.storage import Storage
+
+        if os.path.isfile(self.buffer_url(position)):
+            return True
+
+        storage = Storage()
+        bucket_name = os.environ.get("GOOGLE_BUCKET_NAME", None)
+        file = storage.file(bucket_name, self.checkpoint_path(position))
+        if file.blob is None:
+            return False
+
+        print(
+            f"Restoring buffer at position {position} from {self.checkpoint_path(position)}"
+        )
+        backup = self.buffer_url(position) + ".backup"
+        file.blob.download_to_filename(backup)
+        try:
+            decompress_buffer(backup, self.pipeline.buffer_format, backup + ".tmp")
+            os.replace(backup + ".tmp", self.buffer_url(position))
+        finally:
+            if os.path.isfile(backup):
+                os.remove(backup)
+        return True
+
+    def iter_buffer_csv(self, position=None, offset=0, rows=None, columns=None):
+        """
+        Iterator with the rows of the buffer as csv text, it reads the local buffer if this
+        worker has it or streams the backup from the bucket otherwise, the position is the
+        checkpoint to read (the last backup of the pipeline if None)
+        """
+        buffer_format = self.pipeline.buffer_format
+        if position is not None and os.path.isfile(self.buffer_url(position)):
+            return iter_buffer_csv(
+                self.buffer_url(position), buffer_format, offset, rows, columns
+            )
+
         from breathecode.services.google_cloud.storage import Storage
 
         storage = Storage()
         bucket_name = os.environ.get("GOOGLE_BUCKET_NAME", None)
 
-        backup_path = f"buffer/{self.pipeline.slug}.csv"
-        print(f"Fetching backup from {backup_path}")
+        if position is None:
+            backup_path = self.latest_backup_path()
+        else:
+            backup_path = self.checkpoint_path(position)
 
+        print(f"Streaming backup from {backup_path}")
         file = storage.file(bucket_name, backup_path)
-        return file.stream_download()
+        if file.blob is None:
+            raise Exception(f"Backup {backup_path} not found")
+
+        # the blob is read in chunks, parquet only fetches the row groups it needs
+        source = file.open("rb")
+        try:
+            lines = iter_buffer_csv(
+                source, BACKUP_EXTENSIONS[buffer_format], offset, rows, columns
+            )
+        except Exception:
+            source.close()
+            raise
+
+        def stream():
+            with source:
+                yield from lines
+
+        return stream()
 
 
 class Transformation(models.Model):
@@ -287,6 +864,19 @@ class Transformation(models.Model):
 
     code = models.TextField()
     stdout = models.TextField(blank=True, null=True, default="")
+    peak_memory_mb = models.FloatField(
+        null=True,
+        blank=True,
+        default=None,
+        help_text="Peak memory (RSS) in MB of the worker on the last run",
+    )
+    cache_key = models.CharField(
+        max_length=64,
+        blank=True,
+        null=True,
+        default=None,
+        help_text="Hash of the code and inputs of the output that is kept on the cache",
+    )
 
     last_sync_at = models.DateTimeField(blank=True, null=True, default=None)
     last_run = models.DateTimeField(blank=True, null=True, default=None)
@@ -297,6 +887,23 @@ class Transformation(models.Model):
     def __str__(self):
         return self.slug
 
+    def cache_url(self):
+        extension = BUFFER_EXTENSIONS[self.pipeline.buffer_format]
+        return f"./buffer/cache_{self.id}_{self.slug}.{extension}"
+
+    def get_cached_output(self, cache_key):
+        """Returns the last output if it was generated with the same code and inputs"""
+        if self.cache_key != cache_key or not os.path.isfile(self.cache_url()):
+            return None
+        return read_buffer(self.cache_url(), self.pipeline.buffer_format)
+
+    def save_cached_output(self, cache_key, df):
+        if not os.path.exists("./buffer"):
+            raise Exception('Directory "buffer" does not exists')
+        write_buffer(df, self.cache_url() + ".tmp", self.pipeline.buffer_format)
+        os.replace(self.cache_url() + ".tmp", self.cache_url())
+        self.cache_key = cache_key
+
     def get_code(self):
         if self.code is None:
             return None
@@ -22,6 +22,18 @@ class ExecutionSerializer(serpy.Serializer):
 
 
 
+class ExecutionMetricsSerializer(serpy.Serializer):
+    id = serpy.Field()
+    status = serpy.Field()
+    started_at = serpy.Field()
+    ended_at = serpy.Field()
+    peak_memory_mb = serpy.Field()
+    steps = serpy.MethodField()
+
+    def get_steps(self, obj):
+        return (obj.log or {}).get('steps', [])
+
+
 class ProjectSerializer(serpy.Serializer):
     id = serpy.Field()
     title = serpy.Field()
@@ -1,13 +1,41 @@
-import logging, sys, traceback, json, time
+import logging, sys, traceback, json, time, inspect, hashlib, threading, resource, gc
 import psutil
+import pandas as pd
+import pyarrow as pa
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection, transaction
 from django.utils import timezone
 from celery import shared_task, Task
 from google.cloud.exceptions import NotFound
-from .models import Transformation, PipelineExecution, Pipeline, Project
+from .utils import (
+    get_watermark,
+    max_watermark,
+    dataframe_hash,
+    MemoryWatchdog,
+    MemoryLimitExceeded,
+)
+from .models import (
+    Transformation,
+    PipelineExecution,
+    Pipeline,
+    Project,
+    OPERATIONAL,
+    CRITICAL,
+    ABORTED,
+    IN_PROCESS,
+    EVERY_STEP,
+)
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 
+# how many sources of each type are fetched at the same time on a pipeline
+MAX_CONCURRENT_EXTRACTIONS = {
+    "bigquery": 4,
+    "heroku": 2,
+    "csv": 4,
+}
+
 
 class RetryException(Exception):
     pass
@@ -20,22 +48,107 @@ class BaseTaskWithRetry(Task):
     retry_backoff = True
 
     start_time = time.time()
-    start_memory = psutil.virtual_memory().used
+    start_memory = psutil.Process().memory_info().rss
 
     def __init__(self):
         self.start_time = time.time()
-        self.start_memory = psutil.virtual_memory().used
+        self.start_memory = psutil.Process().memory_info().rss
+
+    def before_start(self, task_id, args, kwargs):
+        # the worker processes are reused, the time and memory are measured for each task
+        self.start_time = time.time()
+        self.start_memory = psutil.Process().memory_info().rss
 
     def log_time_and_memory(self):
         elapsed_time = time.time() - self.start_time
-        current_memory = psutil.virtual_memory().used
+        current_memory = psutil.Process().memory_info().rss
         memory_diff = current_memory - self.start_memory
+        # ru_maxrss is in KB on linux, it is the peak of the whole life of the process
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
         logger.info(
-            f"Elapsed time: {elapsed_time}s, Memory used: {memory_diff / (1024.0 ** 2)} MB"
+            f"Elapsed time: {elapsed_time}s, Memory used: {memory_diff / (1024.0 ** 2)} MB, "
+            f"Process memory: {current_memory / (1024.0 ** 2)} MB, Process peak: {peak_memory} MB"
+        )
+
+
+# compiled run functions by transformation id, the code hash is used to detect changes
+TRANSFORMATIONS_CACHE = {}
+
+
+def load_transformation(transformation):
+    """
+    Compile the transformation code and return its run function and argument spec,
+    they are cached for the whole process until the transformation code changes.
+    """
+    code_hash = hashlib.sha256(transformation.code.encode("utf-8")).hexdigest()
+    cached = TRANSFORMATIONS_CACHE.get(transformation.id)
+    if cached is not None and cached[0] == code_hash:
+        return cached[1], cached[2]
+
+    content = (
+        "import inspect, json\nimport pandas as pd\n"
+        + transformation.get_code()
+        + "\n"
+    )
+    input_vars = {}
+    exec(compile(content, f"<transformation {transformation.slug}>", "exec"), input_vars)
+    if "run" not in input_vars:
+        raise Exception(
+            f"Transformation {transformation.slug} is missing the run function"
         )
 
+    run = input_vars["run"]
+    args_spect = inspect.getfullargspec(run)
+    TRANSFORMATIONS_CACHE[transformation.id] = (code_hash, run, args_spect)
+    return run, args_spect
+
+
+def clear_transformations_cache(ids=None):
+    if ids is None:
+        TRANSFORMATIONS_CACHE.clear()
+        return
+
+    for id in ids:
+        TRANSFORMATIONS_CACHE.pop(id, None)
+
+
+def dataframe_bytes(df):
+    """Memory used by the dataframe, including the content of the strings"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def add_step_metrics(execution, metrics):
+    log = execution.log or {}
+    execution.log = {**log, "steps": log.get("steps", []) + [metrics]}
+
+
+def transformation_cache_key(transformation, dfs):
+    """Hash of the transformation code and the content of its inputs"""
+    h = hashlib.sha256(transformation.code.encode("utf-8"))
+    for df in dfs:
+        h.update(dataframe_hash(df).encode("utf-8"))
+    return h.hexdigest()
+
 
-def run_transformation(transformation, execution):
+def run_transformation(
+    transformation,
+    execution,
+    dfs=None,
+    checkpoint=True,
+    position=0,
+    inputs=None,
+    first_step=True,
+    backup=True,
+):
+    """
+    Run one transformation, the input dataframes are read from the execution buffers
+    (the sources or the given inputs positions) unless they are passed with dfs. The
+    output is only saved into the buffer (at the given position) when checkpoint is True,
+    and uploaded to the bucket on the background unless backup is False.
+    The metrics of the step are added to the execution log. On a batch of stream events,
+    the first step (first_step) runs once per event, the next ones receive the whole batch.
+    Returns the transformation and its output.
+    """
 
     logger.debug(f"Running transformation {transformation.slug}")
     from io import StringIO
@@ -53,25 +166,27 @@ def run_transformation(transformation, execution):
             f"Added stdoutIO to collect log buffers from transformation {transformation.slug}"
         )
 
-    content = transformation.get_code()
-    if content is None:
+    if transformation.code is None or transformation.code == "":
         transformation.status = "CRITICAL"
         transformation.stdout = (
             f"Script not found or its body is empty: {transformation.slug}"
         )
         transformation.save()
-        return False
+        return transformation, None
     else:
         logger.debug(
             f"Transformation {transformation.slug} code looks OK with status {transformation.status}"
         )
-        content = (
-            f'import inspect, json\nimport pandas as pd\nprint("Preparing code for the next transformation: {transformation.slug}")\n'
-            + content
-            + "\n"
-        )
-        logger.debug(f"Pre-prended imports to transformation code")
 
+    output = None
+    watchdog = MemoryWatchdog(limit_mb=execution.pipeline.memory_limit_mb)
+    metrics = {
+        "transformation": transformation.slug,
+        "started_at": timezone.now().isoformat(),
+        "read_seconds": 0,
+        "run_seconds": None,
+        "write_seconds": 0,
+    }
     with stdoutIO() as s:
         try:
             if transformation.pipeline is None:
@@ -79,70 +194,481 @@ def run_transformation(transformation, execution):
                     f"Transformation {transformation.slug} does not belong to any pipeline"
                 )
 
-            input_vars = {}
+            start = time.perf_counter()
+            if dfs is None and inputs is not None:
+                dfs = [execution.get_buffer_df(i) for i in inputs]
+            elif dfs is None:
+                sources = transformation.pipeline.source_from.all()
+                logger.debug(f"Gathering sources for {transformation.status}")
+                dfs = [
+                    execution.get_buffer_df(position)
+                    for position in range(len(sources))
+                ]
+            metrics["read_seconds"] = round(time.perf_counter() - start, 3)
+            metrics["input_rows"] = [len(df) for df in dfs]
+            metrics["input_bytes"] = [dataframe_bytes(df) for df in dfs]
 
-            sources = transformation.pipeline.source_from.all()
-            logger.debug(f"Gathering sources for {transformation.status}")
-            content += "dfs = [] \nkwargs = {}\n"
-            for position in range(len(sources)):
-                content += (
-                    f"dfs.append(pd.read_csv('{execution.buffer_url(position)}')) \n"
-                )
+            print(
+                f"Preparing code for the next transformation: {transformation.slug}"
+            )
+            logger.info(f"Executing transformation {transformation.slug}...")
+            run, args_spect = load_transformation(transformation)
+            print(
+                f"Starting {transformation.slug}: with {len(dfs)} dataframes -> {dfs[0].shape if len(dfs) > 0 else None}"
+            )
 
+            kwargs = {}
             if execution.incoming_stream is not None:
-                content += (
-                    "payload = '" + json.dumps(execution.incoming_stream) + "' \n"
+                events = (
+                    execution.incoming_stream
+                    if execution.stream_batch
+                    else [execution.incoming_stream]
                 )
-                content += 'kwargs["stream"] = json.loads(payload) \n'
+                if "stream" in args_spect.args:
+                    kwargs["stream"] = json.loads(json.dumps(execution.incoming_stream))
+                if "stream_df" in args_spect.args:
+                    kwargs["stream_df"] = pd.json_normalize(events)
+                if len(kwargs) == 0:
+                    raise Exception(
+                        'Transformation needs a "stream" or "stream_df" parameter to receive incoming streaming data'
+                    )
 
-            content += f"""
-print('Starting {transformation.slug}: with '+str(len(dfs))+' dataframes -> '+str(dfs[0].shape))
+            args = dfs[: len(args_spect.args) - len(kwargs.keys())]
+            cache_key = None
+            if execution.pipeline.cache_outputs and execution.incoming_stream is None:
+                # same code and same inputs, same output
+                cache_key = transformation_cache_key(transformation, args)
+                output = transformation.get_cached_output(cache_key)
+                metrics["cached"] = output is not None
 
-args_spect = inspect.getfullargspec(run)
-if "stream" in kwargs and "stream" not in args_spect.args:
-    raise Exception('Transformation needs a "stream" parameter to receive incoming streaming data')
+            start = time.perf_counter()
+            if output is not None:
+                print(f"Reusing the last output of {transformation.slug}, its code and inputs did not change")
+            else:
+                with watchdog:
+                    if execution.stream_batch and "stream_df" not in kwargs and first_step:
+                        # transformations without stream_df receive one event at a time,
+                        # the next steps already get the rows of every event
+                        output = pd.concat(
+                            [run(*args, stream=event) for event in kwargs["stream"]],
+                            ignore_index=True,
+                        )
+                    else:
+                        output = run(*args, **kwargs)
+                if cache_key is not None:
+                    transformation.save_cached_output(cache_key, output)
+            metrics["run_seconds"] = round(time.perf_counter() - start, 3)
+            metrics["output_rows"] = len(output)
+            metrics["output_bytes"] = dataframe_bytes(output)
+            print(f"Ended transformation {transformation.slug}: output -> {output.shape}")
+            if checkpoint:
+                start = time.perf_counter()
+                execution.save_buffer_df(output, position=position)
+                metrics["write_seconds"] = round(time.perf_counter() - start, 3)
 
-output = run(*dfs[:len(args_spect.args) - len(kwargs.keys())], **kwargs)
-print('Ended transformation {transformation.slug}: output -> '+str(output.shape))
-output.to_csv('{execution.buffer_url()}', index=False)\n
-"""
-            logger.info(f"Executing transformation {transformation.slug}...")
-            exec(content, input_vars)
             logger.info(f"Finalizing transformation {transformation.slug} execution.")
             transformation.status_code = 0
             transformation.status = "OPERATIONAL"
             transformation.stdout = s.getvalue()
 
+        except MemoryLimitExceeded:
+            output = None
+            gc.collect()
+            transformation.stdout = (
+                s.getvalue()
+                + f"\nTransformation {transformation.slug} was aborted, it used more memory than the pipeline limit of {watchdog.limit_mb} MB"
+            )
+            transformation.status_code = 1
+            transformation.status = "CRITICAL"
+
         except Exception as e:
             logger.debug(
                 f"Exception just happened running transformation {transformation.slug}"
             )
+            transformation.stdout = s.getvalue()
             transformation.log_exception(e)
             transformation.status_code = 1
             transformation.status = "CRITICAL"
 
+    if watchdog.peak > 0:
+        transformation.peak_memory_mb = watchdog.peak_mb
+        execution.peak_memory_mb = max(execution.peak_memory_mb or 0, watchdog.peak_mb)
+        print(f"Peak memory of {transformation.slug}: {watchdog.peak_mb} MB")
+
+    metrics["status"] = transformation.status
+    metrics["peak_memory_mb"] = transformation.peak_memory_mb
+    transformation.metrics = metrics
+    add_step_metrics(execution, metrics)
+
     transformation.last_run = timezone.now()
     transformation.save()
-    async_backup_buffer.delay(execution.id, position=0)
+    if checkpoint and backup and transformation.status == OPERATIONAL:
+        async_backup_buffer.delay(execution.id, position=position)
 
     logger.debug(
         f"Finished transformation {transformation.slug} execution with status {transformation.status}."
     )
-    return transformation
+    return transformation, output
+
+
+def run_transformations_in_process(
+    execution, transformations, dfs=None, checkpoints=True, every_step=False
+):
+    """
+    Run all the pending transformations of an execution in the current process, the
+    output of each transformation is passed in memory to the next one (in place of the
+    first source) and only saved into the buffer following the pipeline checkpoint
+    policy (or every step), or when a transformation fails. Nothing is saved into the
+    buffer if checkpoints is False. The transformations that are already saved into the
+    buffer are kept on the execution log, the execution resumes after the last of them.
+    Returns the last transformation that ran and the last successful output.
+    """
+    pipeline = execution.pipeline
+    pipe = pipeline.project.get_config(pipeline.slug)
+    if dfs is None:
+        dfs = [None] * len(pipe["sources"])
+
+    positions = list(range(len(dfs)))
+    completed = (execution.log or {}).get("completed", [])
+    if len(completed) > 0 and len(dfs) > 0:
+        # resume from the output of the last transformation saved into the buffer
+        positions[0] = buffer_position(pipe, completed[-1])
+        dfs[0] = None
+
+    # sources that were not passed in memory are read from the buffer
+    dfs = [
+        execution.get_buffer_df(positions[index]) if df is None else df
+        for index, df in enumerate(dfs)
+    ]
+
+    t = None
+    output = dfs[0] if len(dfs) > 0 else None
+    checkpointed = True
+    done = []
+    # the sources are the input of the first step unless the execution is resumed
+    first_step = len(completed) == 0
+    while len(transformations) > 0:
+        # stream executions are only checked once, before they start
+        if execution.incoming_stream is None and is_aborted(execution):
+            execution.status = ABORTED
+            execution.stdout += "Aborted by admin user."
+            break
+
+        next = transformations.pop()
+        t = Transformation.objects.filter(pipeline__slug=pipeline.slug, slug=next).first()
+        checkpoint = checkpoints and (
+            len(transformations) == 0
+            or every_step
+            or pipeline.checkpoint == EVERY_STEP
+        )
+        t, result = run_transformation(
+            t,
+            execution,
+            dfs=dfs,
+            checkpoint=checkpoint,
+            position=buffer_position(pipe, next),
+            first_step=first_step,
+        )
+        first_step = False
+
+        execution.stdout += t.stdout
+        execution.status = t.status
+        execution.save()
+
+        if t.status != OPERATIONAL:
+            if checkpoints and not checkpointed:
+                # keep the last good output to be able to resume from the failure
+                execution.save_buffer_df(output, position=buffer_position(pipe, done[-1]))
+                async_backup_buffer.delay(execution.id, position=buffer_position(pipe, done[-1]))
+                mark_completed(execution, done)
+            break
+
+        output = result
+        dfs = [output] + dfs[1:]
+        checkpointed = checkpoint
+        done.append(next)
+        if checkpoint:
+            mark_completed(execution, done)
+            done = []
+        logger.info(f"{len(transformations)} transformations left to run...")
+
+    return t, output
+
+
+def is_aborted(execution):
+    return PipelineExecution.objects.filter(id=execution.id, status=ABORTED).exists()
+
+
+def mark_completed(execution, slugs):
+    """Keep the transformations that are saved into the buffer to resume after them"""
+    log = execution.log or {}
+    execution.log = {**log, "completed": log.get("completed", []) + slugs}
+    execution.save()
+
+
+def buffer_position(pipe, slug):
+    """
+    Buffer position of a source, the output of each transformation is kept after the
+    sources (in the order they were declared) to be able to resume from any of them.
+    """
+    if slug in pipe["sources"]:
+        return pipe["sources"].index(slug)
+    return len(pipe["sources"]) + pipe["transformations"].index(slug)
+
+
+def dag_ready_nodes(pipe, completed, started):
+    """Transformations that did not start yet and have all their inputs ready"""
+    return [
+        slug
+        for slug, inputs in pipe["dag"].items()
+        if slug not in started
+        and all(i in pipe["sources"] or i in completed for i in inputs)
+    ]
+
+
+def run_dag_in_process(execution, pipe, dfs=None, checkpoints=True):
+    """
+    Run the transformations of a pipeline graph in the current process, following the
+    order they were declared in (each one can only consume previous ones), the outputs
+    are kept in memory until all the transformations that consume them finished.
+    Returns the last transformation that ran and its output.
+    """
+    pipeline = execution.pipeline
+    if dfs is None:
+        dfs = [None] * len(pipe["sources"])
+
+    outputs = {
+        slug: execution.get_buffer_df(position) if df is None else df
+        for position, (slug, df) in enumerate(zip(pipe["sources"], dfs))
+    }
+    consumers = {}
+    for inputs in pipe["dag"].values():
+        for i in inputs:
+            consumers[i] = consumers.get(i, 0) + 1
+
+    t = None
+    output = None
+    for slug in pipe["transformations"]:
+        # stream executions are only checked once, before they start
+        if execution.incoming_stream is None and is_aborted(execution):
+            execution.status = ABORTED
+            execution.stdout += "Aborted by admin user."
+            break
+
+        t = Transformation.objects.filter(pipeline__slug=pipeline.slug, slug=slug).first()
+        checkpoint = checkpoints and (
+            slug == pipe["transformations"][-1] or pipeline.checkpoint == EVERY_STEP
+        )
+        t, output = run_transformation(
+            t,
+            execution,
+            dfs=[outputs[i] for i in pipe["dag"][slug]],
+            checkpoint=checkpoint,
+            position=buffer_position(pipe, slug),
+            first_step=all(i in pipe["sources"] for i in pipe["dag"][slug]),
+        )
+
+        execution.stdout += t.stdout
+        execution.status = t.status
+        execution.save()
+
+        if t.status != OPERATIONAL:
+            break
+
+        outputs[slug] = output
+        for i in pipe["dag"][slug]:
+            consumers[i] -= 1
+            if consumers[i] == 0:
+                # nobody else needs it, free the memory
+                del outputs[i]
+
+    return t, output
+
+
+def track_watermark(chunks, column, watermarks, key):
+    """Keep the highest value of the watermark column while the chunks are read"""
+    for chunk in chunks:
+        df = chunk
+        if not isinstance(chunk, pd.DataFrame):
+            # arrow record batches
+            df = pa.Table.from_batches([chunk]).select([column]).to_pandas()
+
+        watermarks[key] = max_watermark(watermarks[key], get_watermark(df, column))
+        yield chunk
+
+
+def merge_into_destination(pipeline, TO_DB, df):
+    """Insert or update the rows of the dataframe by the primary key of the destination"""
+    if not hasattr(TO_DB, "merge_dataframe_into_table"):
+        raise Exception(
+            f"Datasource type {pipeline.source_to.source_type} does not support merge"
+        )
+
+    primary_key = pipeline.source_to.get_primary_key()
+    TO_DB.merge_dataframe_into_table(
+        # only the last version of each row is kept
+        df.drop_duplicates(subset=primary_key, keep="last"),
+        pipeline.destination_table_name(),
+        primary_key=primary_key,
+        quoted_newlines=pipeline.source_to.quoted_newlines,
+    )
+
+
+def save_execution_output(execution, df=None):
+    """
+    Save the output of the execution (the last transformation output by default) into
+    the pipeline destination, updates the status of the execution and its pipeline.
+    """
+    pipeline = execution.pipeline
+    logger.debug(
+        f"No more transformations to apply for execution {execution.id}, saving into datasource"
+    )
+    log = execution.log or {}
+    try:
+        logger.debug(f"Saving pipeline {pipeline.slug} buffer to datasource")
+        if df is None:
+            # the output of the last transformation
+            pipe = pipeline.project.get_config(pipeline.slug)
+            df = execution.get_buffer_df(buffer_position(pipe, pipe["transformations"][-1]))
+        # incremental executions only have the new rows
+        replace = pipeline.replace_destination_table and not log.get("incremental", False)
+        TO_DB = pipeline.source_to.get_source()
+
+        output_hash = None
+        unchanged = False
+        if pipeline.cache_outputs:
+            output_hash = dataframe_hash(df)
+            # writing the same output again only makes sense if it is appended
+            unchanged = output_hash == pipeline.last_output_hash and (
+                replace or pipeline.merge_destination_table
+            )
+
+        if unchanged:
+            execution.stdout += f"The output did not change since the last execution, {pipeline.destination_table_name()} was not updated"
+        elif pipeline.merge_destination_table:
+            merge_into_destination(pipeline, TO_DB, df)
+        elif log.get("incremental", False):
+            TO_DB.append_dataframe_to_table(
+                df,
+                pipeline.destination_table_name(),
+                quoted_newlines=pipeline.source_to.quoted_newlines,
+            )
+        else:
+            TO_DB.save_dataframe_to_table(
+                df,
+                pipeline.destination_table_name(),
+                replace=replace,
+                quoted_newlines=pipeline.source_to.quoted_newlines,
+            )
+        pipeline.last_output_hash = output_hash
+        pipeline.status = "OPERATIONAL"
+        execution.status = "OPERATIONAL"
+        if not unchanged:
+            execution.stdout += f"Saved to database {pipeline.source_to.title} in table: {pipeline.destination_table_name()}"
+
+        if "watermarks" in log:
+            pipeline.watermarks = {**(pipeline.watermarks or {}), **log["watermarks"]}
+
+        if pipeline.downstream.exists():
+            share_output(pipeline, TO_DB, df, full=not log.get("incremental", False))
+            pipeline.ended_at = timezone.now()
+            pipeline.save()
+            trigger_downstream(pipeline)
+
+    except NotFound as e:
+        logger.debug(f"Error saving buffer for pipeline {pipeline.slug}")
+        msg = f"Dataset table not found for {pipeline.source_to.source_type}.{pipeline.source_to.database} -> table: {pipeline.source_to.table_name}"
+        pipeline.status = "CRITICAL"
+
+        execution.stdout += msg
+        execution.status = "CRITICAL"
+
+    except Exception as e:
+        logger.exception(f"Error running pipeline {pipeline.slug}")
+        pipeline.status = "CRITICAL"
+        execution.log_exception(e)
+        execution.status = "CRITICAL"
+
+
+def share_output(pipeline, TO_DB, df, full=True):
+    """
+    Keep the output of the pipeline for its downstream pipelines, only if it has the whole
+    content of the destination, otherwise they need to read it from the destination. It is
+    kept the way the destination stores it (column names and types), the destinations that
+    can't tell how are always read again.
+    """
+    if (
+        full
+        and pipeline.replace_destination_table
+        and not pipeline.merge_destination_table
+        and hasattr(TO_DB, "stored_dataframe")
+    ):
+        pipeline.save_output_df(TO_DB.stored_dataframe(df))
+    else:
+        pipeline.remove_output()
+
+
+def trigger_downstream(pipeline):
+    """Run the pipelines that depend on this one if all their upstream pipelines are done"""
+    now = timezone.now()
+    for downstream in pipeline.downstream.all():
+        if downstream.paused_until is not None and downstream.paused_until > now:
+            continue
+        if downstream.upstream_is_ready():
+            logger.info(f"Triggering downstream pipeline {downstream.slug}")
+            async_run_pipeline.delay(downstream.slug, downstream.project.slug)
+
+
+def append_execution_output(execution, df):
+    """
+    Append the output of a stream execution at the end of the pipeline destination,
+    updates the status of the execution.
+    """
+    pipeline = execution.pipeline
+    try:
+        TO_DB = pipeline.source_to.get_source()
+        if pipeline.merge_destination_table:
+            merge_into_destination(pipeline, TO_DB, df)
+        else:
+            TO_DB.append_dataframe_to_table(
+                df,
+                pipeline.destination_table_name(),
+                quoted_newlines=pipeline.source_to.quoted_newlines,
+            )
+        execution.status = "OPERATIONAL"
+        execution.stdout += f"Appended {df.shape[0]} rows to {pipeline.source_to.title} in table: {pipeline.destination_table_name()}"
+
+    except NotFound as e:
+        msg = f"Dataset table not found for {pipeline.source_to.source_type}.{pipeline.source_to.database} -> table: {pipeline.source_to.table_name}"
+        execution.stdout += msg
+        execution.status = "CRITICAL"
+
+    except Exception as e:
+        logger.exception(f"Error streaming into pipeline {pipeline.slug}")
+        execution.log_exception(e)
+        execution.status = "CRITICAL"
+
 
 @shared_task(bind=True, base=BaseTaskWithRetry)
 def async_run_transformation(self, execution_id, transformations):
+    """
+    Coordinate all the pending transformations of an execution in one task, the output
+    of every step is saved into the buffer, if the task is run again (retries or a
+    resume) the transformations that were already saved are skipped.
+    """
     try:
-        print(
-            f"Starting async_run_transformation for PipelineExecution({execution_id}) with {len(transformations)} transformations pending"
-        )
-
         self.log_time_and_memory()
         execution = PipelineExecution.objects.filter(id=execution_id).first()
         if execution is None:
             raise Exception(f"Execution with id {execution_id} not found")
         pipeline = execution.pipeline
 
+        completed = (execution.log or {}).get("completed", [])
+        transformations = [t for t in transformations if t not in completed]
+        print(
+            f"Starting async_run_transformation for PipelineExecution({execution_id}) with {len(transformations)} transformations pending"
+        )
+
         if len(transformations) == 0:
             return True
 
@@ -155,56 +681,21 @@ def async_run_transformation(self, execution_id, transformations):
             execution.save()
             return False
 
-        next = transformations.pop()
-        t = Transformation.objects.filter(pipeline__slug=pipeline.slug, slug=next).first()
-        t = run_transformation(t, execution)
+        t, output = run_transformations_in_process(
+            execution, transformations, every_step=True
+        )
 
         # update pipeline
-        pipeline.status = t.status
+        pipeline.status = execution.status
         pipeline.ended_at = timezone.now()
 
         # update execution
-        execution.stdout += t.stdout
-        execution.status = t.status
         execution.ended_at = timezone.now()
         execution.save()
 
-        logger.info(f"{len(transformations)} transformations left to run...")
-        if len(transformations) == 0 and t.status == "OPERATIONAL":
+        if t is not None and t.status == OPERATIONAL and execution.status != ABORTED:
             # no more transformations to apply, save in the database
-            logger.debug(
-                f"No more transformations to apply for execution {execution.id}, saving into datasource"
-            )
-            try:
-                logger.debug(f"Saving pipeline {pipeline.slug} buffer to datasource")
-                df = execution.get_buffer_df()
-                TO_DB = t.pipeline.source_to.get_source()
-                TO_DB.save_dataframe_to_table(
-                    df,
-                    pipeline.destination_table_name(),
-                    replace=pipeline.replace_destination_table,
-                    quoted_newlines=pipeline.source_to.quoted_newlines,
-                )
-                pipeline.status = "OPERATIONAL"
-                execution.status = "OPERATIONAL"
-                execution.stdout += f"Saved to database {pipeline.source_to.title} in table: {pipeline.destination_table_name()}"
-
-            except NotFound as e:
-                logger.debug(f"Error saving buffer for pipeline {pipeline.slug}")
-                msg = f"Dataset table not found for {pipeline.source_to.source_type}.{pipeline.source_to.database} -> table: {pipeline.source_to.table_name}"
-                pipeline.status = "CRITICAL"
-
-                execution.stdout += msg
-                execution.status = "CRITICAL"
-
-            except Exception as e:
-                logger.exception(f"Error running pipeline {pipeline.slug}")
-                pipeline.status = "CRITICAL"
-                execution.log_exception(e)
-                execution.status = "CRITICAL"
-
-        elif len(transformations) > 0 and t.status == "OPERATIONAL":
-            async_run_transformation.delay(execution_id, transformations)
+            save_execution_output(execution, output)
 
         pipeline.save()
         execution.save()
@@ -232,6 +723,317 @@ def async_run_transformation(self, execution_id, transformations):
         raise  # Opcional: vuelve a lanzar la excepción para manejo por Celery si quieres reintentos
 
 
+def extract_source(execution, pipe, source_from, semaphore, upstream=None):
+    """
+    Read one of the pipeline sources and save it into its buffer, it runs on a separate
+    thread so every source of the pipeline is fetched at the same time. Sources that are
+    the destination of an upstream pipeline are taken from its output when possible.
+
+    Returns the buffer position, the dataframe (only when the pipeline runs in process)
+    and the new watermark of the source.
+    """
+    pipeline = execution.pipeline
+    position = pipe["sources"].index(source_from.slug)
+    watermarks = {source_from.slug: None}
+
+    settings = pipe.get("source_settings", {}).get(source_from.slug, {})
+    if (
+        upstream is not None
+        and not source_from.watermark_column
+        and not settings.get("filter", None)
+    ):
+        df = upstream.get_output_df()
+        if df is not None:
+            print(f"Reading source {source_from.slug} from pipeline {upstream.slug} output")
+            if settings.get("columns", None):
+                df = df[settings["columns"]]
+            execution.save_buffer_df(df, position=position)
+            connection.close()
+            if pipeline.execution_mode != IN_PROCESS:
+                df = None
+            return position, df, None
+
+    # column projection and filter declared for this source on the project.yml
+    columns = settings.get("columns", None)
+    where = settings.get("filter", None)
+    if columns and source_from.watermark_column and source_from.watermark_column not in columns:
+        columns = [*columns, source_from.watermark_column]
+    if columns or where:
+        print(f"Reading columns {columns or '*'} where {where}")
+
+    with semaphore:
+        print(
+            f"Saving buffer to datasource {source_from.title} of type {source_from.source_type}"
+        )
+        if not source_from.watermark_column:
+            try:
+                # the same download is shared by all the pipelines reading this source,
+                # but a pipeline never reads data older than its own frequency
+                max_age = min(source_from.snapshot_ttl, pipeline.frequency_delta_minutes)
+                path = source_from.get_snapshot(max_age, columns=columns, where=where)
+                execution.load_buffer_from(path, position=position)
+                print(f"Buffer saved correctly for source {source_from.slug}")
+
+                df = None
+                if pipeline.execution_mode == IN_PROCESS:
+                    df = execution.get_buffer_df(position)
+                return position, df, None
+
+            finally:
+                # every thread opens its own database connection
+                connection.close()
+
+        FROM_DB = source_from.get_source()
+        try:
+            last_watermark = (pipeline.watermarks or {}).get(source_from.slug)
+            watermarks[source_from.slug] = last_watermark
+            kwargs = {
+                "watermark_column": source_from.watermark_column,
+                "watermark": last_watermark,
+            }
+            print(f"Reading rows after {source_from.watermark_column} {last_watermark}")
+            if columns or where:
+                kwargs = {**kwargs, "columns": columns, "where": where}
+
+            chunks = source_from.read_chunks(FROM_DB, **kwargs)
+            if chunks is not None:
+                chunks = track_watermark(
+                    chunks, source_from.watermark_column, watermarks, source_from.slug
+                )
+                execution.save_buffer_chunks(chunks, position=position)
+                print(f"Buffer saved correctly for source {source_from.slug}")
+                # the chunks are never together in memory, they are read back from the buffer
+                return position, None, watermarks[source_from.slug]
+
+            df = FROM_DB.get_dataframe_from_table(source_from.table_name, **kwargs)
+            # Print the shape of the dataframe
+            print(f"Buffer shape: {df.shape}")
+
+            watermarks[source_from.slug] = max_watermark(
+                watermarks[source_from.slug],
+                get_watermark(df, source_from.watermark_column),
+            )
+
+            execution.save_buffer_df(df, position=position)
+            print(f"Buffer saved correctly for source {source_from.slug}")
+
+            if pipeline.execution_mode != IN_PROCESS:
+                df = None
+            return position, df, watermarks[source_from.slug]
+
+        finally:
+            if hasattr(FROM_DB, "close"):
+                FROM_DB.close()
+            # every thread opens its own database connection
+            connection.close()
+
+
+def start_dag(execution, pipe):
+    """
+    Enqueue the transformations of the pipeline graph that only consume sources, the
+    sources are uploaded first because the transformations can run on other workers.
+    """
+    for slug in pipe["sources"]:
+        execution.backup_buffer(buffer_position(pipe, slug))
+
+    ready = dag_ready_nodes(pipe, completed=[], started=[])
+    execution.log = {
+        **(execution.log or {}),
+        "dag": {"started": ready, "completed": []},
+    }
+    execution.save()
+    for slug in ready:
+        async_run_dag_node.delay(execution.id, slug)
+
+
+@shared_task(bind=True, base=BaseTaskWithRetry)
+def async_run_dag_node(self, execution_id, slug):
+    """
+    Run one transformation of a pipeline graph on its own task, when it finishes the
+    transformations that were waiting for its output are enqueued, that way the
+    independent branches of the graph run in parallel on different workers.
+    """
+    self.log_time_and_memory()
+    execution = PipelineExecution.objects.filter(id=execution_id).first()
+    if execution is None:
+        raise Exception(f"Execution with id {execution_id} not found")
+
+    pipeline = execution.pipeline
+    if execution.status in [ABORTED, CRITICAL]:
+        # another branch failed or the execution was aborted
+        return False
+
+    pipe = pipeline.project.get_config(pipeline.slug)
+    t = Transformation.objects.filter(pipeline__slug=pipeline.slug, slug=slug).first()
+    position = buffer_position(pipe, slug)
+    t, output = run_transformation(
+        t,
+        execution,
+        position=position,
+        inputs=[buffer_position(pipe, i) for i in pipe["dag"][slug]],
+        backup=False,
+    )
+    if t.status == OPERATIONAL:
+        # the transformations that consume this output can run on other workers
+        try:
+            execution.backup_buffer(position)
+        except Exception as e:
+            t.log_exception(e)
+            t.status = CRITICAL
+
+    # several branches can finish at the same time, the execution is locked to update it
+    with transaction.atomic():
+        execution = PipelineExecution.objects.select_for_update().get(id=execution_id)
+        # the same pipeline instance, the output updates its status and watermarks
+        execution.pipeline = pipeline
+        execution.stdout = (execution.stdout or "") + t.stdout
+        state = execution.log["dag"]
+        if t.peak_memory_mb is not None:
+            execution.peak_memory_mb = max(execution.peak_memory_mb or 0, t.peak_memory_mb)
+        if hasattr(t, "metrics"):
+            add_step_metrics(execution, t.metrics)
+
+        ready = []
+        if t.status != OPERATIONAL:
+            execution.status = t.status
+            execution.ended_at = timezone.now()
+        elif execution.status not in [ABORTED, CRITICAL]:
+            state["completed"].append(slug)
+            ready = dag_ready_nodes(pipe, state["completed"], state["started"])
+            state["started"] += ready
+
+        execution.save()
+
+    logger.info(f"{len(pipe['dag']) - len(state['completed'])} transformations left to run...")
+    for next in ready:
+        async_run_dag_node.delay(execution_id, next)
+
+    finished = t.status == OPERATIONAL and len(state["completed"]) == len(pipe["dag"])
+    if finished:
+        # the last transformation is the output of the graph
+        save_execution_output(execution, output)
+        execution.ended_at = timezone.now()
+        execution.save()
+
+    if finished or t.status != OPERATIONAL:
+        # other branches could still be running, the pipeline is only saved once it ended
+        pipeline.status = execution.status
+        pipeline.ended_at = timezone.now()
+        pipeline.save()
+    return True
+
+
+def dag_descendants(pipe, slug):
+    """The transformation and all the transformations that depend on its output"""
+    found = [slug]
+    for t in pipe["transformations"]:
+        if any(i in found for i in pipe["dag"][t]) and t not in found:
+            found.append(t)
+    return found
+
+
+@shared_task(bind=True, base=BaseTaskWithRetry)
+def async_resume_execution(self, execution_id, transformation=None):
+    """
+    Run an execution again from the given transformation (or after the last one saved into
+    the buffer), the output of the previous transformations is read from their checkpoints
+    and only the sources that are not on this worker anymore are extracted again.
+    """
+    execution = PipelineExecution.objects.filter(id=execution_id).first()
+    if execution is None:
+        raise Exception(f"Execution with id {execution_id} not found")
+
+    pipeline = execution.pipeline
+    pipe = pipeline.project.get_config(pipeline.slug)
+    log = execution.log or {}
+
+    if "dag" in pipe:
+        completed = log.get("dag", {}).get("completed", [])
+        if transformation is not None:
+            rerun = dag_descendants(pipe, transformation)
+            completed = [slug for slug in completed if slug not in rerun]
+        checkpoints = completed
+    else:
+        completed = log.get("completed", [])
+        if transformation is not None:
+            index = pipe["transformations"].index(transformation)
+            completed = pipe["transformations"][:index]
+        checkpoints = completed[-1:]
+
+    # only the destination write failed, the output is the last checkpoint
+    written = len(completed) == len(pipe["transformations"])
+    if written:
+        checkpoints = pipe["transformations"][-1:]
+
+    for slug in checkpoints:
+        if not execution.restore_buffer(buffer_position(pipe, slug)):
+            raise Exception(
+                f"Checkpoint of transformation {slug} not found, the pipeline needs to run again"
+            )
+
+    # the first source is not needed anymore once a linear pipeline has a checkpoint
+    sources = pipeline.source_from.all()
+    if "dag" not in pipe and len(checkpoints) > 0:
+        sources = sources.exclude(slug=pipe["sources"][0])
+    if written:
+        sources = sources.none()
+
+    for source_from in sources:
+        if not execution.restore_buffer(buffer_position(pipe, source_from.slug)):
+            print(f"Extracting source {source_from.slug} again")
+            position, _, watermark = extract_source(
+                execution, pipe, source_from, threading.BoundedSemaphore(1)
+            )
+            # the resumed transformations run on another task, maybe on another worker
+            execution.backup_buffer(position)
+            if source_from.watermark_column:
+                log["watermarks"] = {**log.get("watermarks", {}), source_from.slug: watermark}
+
+    execution.status = "LOADING"
+    execution.ended_at = None
+    execution.stdout = (execution.stdout or "") + (
+        f"\nResuming from transformation {transformation or 'after the last checkpoint'}\n"
+    )
+    resumed = log.get("resumed", []) + [
+        {"transformation": transformation, "at": timezone.now().isoformat()}
+    ]
+    pipeline.status = "LOADING"
+    pipeline.started_at = timezone.now()
+    pipeline.save()
+
+    if written:
+        execution.log = {**log, "resumed": resumed}
+        save_execution_output(execution)
+        execution.ended_at = timezone.now()
+        execution.save()
+
+        pipeline.status = execution.status
+        pipeline.ended_at = timezone.now()
+        pipeline.save()
+        return True
+
+    if "dag" in pipe:
+        ready = dag_ready_nodes(pipe, completed, completed)
+        execution.log = {
+            **log,
+            "resumed": resumed,
+            "dag": {"started": completed + ready, "completed": completed},
+        }
+        execution.save()
+        for slug in ready:
+            async_run_dag_node.delay(execution.id, slug)
+        return True
+
+    execution.log = {**log, "resumed": resumed, "completed": completed}
+    execution.save()
+    slugs = list(
+        Transformation.objects.filter(pipeline__slug=pipeline.slug)
+        .order_by("-order")
+        .values_list("slug", flat=True)
+    )
+    async_run_transformation.delay(execution.id, slugs)
+    return True
+
 
 @shared_task(bind=True, base=BaseTaskWithRetry)
 def async_run_pipeline(self, pipeline_slug, project_slug, execution_id=None):
@@ -251,6 +1053,8 @@ def async_run_pipeline(self, pipeline_slug, project_slug, execution_id=None):
         execution = PipelineExecution(pipeline=pipeline)
         execution.save()  # save to get an id
 
+    # share the same instance, the execution updates the pipeline watermarks
+    execution.pipeline = pipeline
     execution.started_at = timezone.now()
     pipeline.started_at = timezone.now()
     execution.save()
@@ -267,19 +1071,54 @@ def async_run_pipeline(self, pipeline_slug, project_slug, execution_id=None):
         )
 
         pipe = pipeline.project.get_config(pipeline.slug)
-        for source_from in pipeline.source_from.all():
-            print(
-                f"Saving buffer to datasource {source_from.title} of type {source_from.source_type}"
-            )
-            FROM_DB = source_from.get_source()
-            df = FROM_DB.get_dataframe_from_table(source_from.table_name)
-            # Print the shape of the dataframe
-            print(f"Buffer shape: {df.shape}")
+        dfs = [None] * len(pipe["sources"])
+        watermarks = {}
 
-            execution.save_buffer_df(
-                df, position=pipe["sources"].index(source_from.slug)
+        # the sources are fetched concurrently, bounded by source type
+        sources = list(pipeline.source_from.all())
+        upstream = {u.source_to_id: u for u in pipeline.upstream.all()}
+        semaphores = {
+            source_type: threading.BoundedSemaphore(
+                MAX_CONCURRENT_EXTRACTIONS.get(source_type, 1)
             )
-            print("Buffer saved correctly for previous source")
+            for source_type in set(s.source_type for s in sources)
+        }
+        with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+            futures = [
+                executor.submit(
+                    extract_source,
+                    execution,
+                    pipe,
+                    source_from,
+                    semaphores[source_from.source_type],
+                    upstream.get(source_from.id, None),
+                )
+                for source_from in sources
+            ]
+            # wait for all the sources, the first error is raised after that
+            results = [f.exception() or f.result() for f in futures]
+
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        for source_from, (position, df, watermark) in zip(sources, results):
+            if source_from.watermark_column:
+                watermarks[source_from.slug] = watermark
+            if pipeline.execution_mode == IN_PROCESS:
+                dfs[position] = df
+
+        if len(watermarks) > 0:
+            # the watermarks are saved into the pipeline after writing the destination
+            execution.log = {
+                **(execution.log or {}),
+                "watermarks": watermarks,
+                "incremental": any(
+                    (pipeline.watermarks or {}).get(slug) is not None
+                    for slug in watermarks
+                ),
+            }
+            execution.save()
 
         # get transformations queue
         transformations = list(
@@ -287,7 +1126,24 @@ def async_run_pipeline(self, pipeline_slug, project_slug, execution_id=None):
             .order_by("-order")
             .all()
         )
-        async_run_transformation.delay(execution.id, [t.slug for t in transformations])
+        slugs = [t.slug for t in transformations]
+
+        if "dag" in pipe and pipeline.execution_mode == IN_PROCESS:
+            t, df = run_dag_in_process(execution, pipe, dfs=dfs)
+            if t is not None and t.status == OPERATIONAL and execution.status != ABORTED:
+                save_execution_output(execution, df)
+            execution.ended_at = timezone.now()
+            pipeline.ended_at = timezone.now()
+        elif "dag" in pipe:
+            start_dag(execution, pipe)
+        elif pipeline.execution_mode == IN_PROCESS:
+            t, df = run_transformations_in_process(execution, slugs, dfs=dfs)
+            if t is not None and t.status == OPERATIONAL and execution.status != ABORTED:
+                save_execution_output(execution, df)
+            execution.ended_at = timezone.now()
+            pipeline.ended_at = timezone.now()
+        else:
+            async_run_transformation.delay(execution.id, slugs)
 
     except NotFound as e:
         sources_from = [
@@ -306,6 +1162,118 @@ def async_run_pipeline(self, pipeline_slug, project_slug, execution_id=None):
     return True
 
 
+def run_stream(execution):
+    """
+    Clean the incoming stream of an execution and append it to the pipeline
+    destination, the sources are only used as lookup context and they come
+    from the snapshots of each datasource instead of being downloaded again.
+    """
+    pipeline = execution.pipeline
+    if execution.stdout is None:
+        execution.stdout = ""
+
+    # the execution was just loaded, its transformations don't check it again
+    if execution.status == ABORTED:
+        execution.stdout += "Aborted by admin user."
+        execution.ended_at = timezone.now()
+        execution.save()
+        return
+
+    try:
+        if pipeline.source_to is None:
+            raise Exception(f"Pipeline {pipeline.slug} is missing source_to (destination)")
+
+        pipe = pipeline.project.get_config(pipeline.slug)
+        dfs = [None] * len(pipe["sources"])
+        for source_from in pipeline.source_from.all():
+            # the same snapshot downloaded by the batch executions of the pipeline, the
+            # events don't wait for it to be downloaded again if there is an older one
+            settings = pipe.get("source_settings", {}).get(source_from.slug, {})
+            dfs[pipe["sources"].index(source_from.slug)] = source_from.get_snapshot_df(
+                columns=settings.get("columns", None),
+                where=settings.get("filter", None),
+                stale=True,
+            )
+
+        if "dag" in pipe:
+            t, df = run_dag_in_process(execution, pipe, dfs=dfs, checkpoints=False)
+        else:
+            transformations = list(
+                Transformation.objects.filter(pipeline__slug=pipeline.slug)
+                .order_by("-order")
+                .values_list("slug", flat=True)
+            )
+            t, df = run_transformations_in_process(
+                execution, transformations, dfs=dfs, checkpoints=False
+            )
+        if t is not None and t.status == OPERATIONAL and execution.status != ABORTED:
+            append_execution_output(execution, df)
+
+    except NotFound as e:
+        sources_from = [
+            f"{s.source_type}.{s.database} -> table: {s.table_name}"
+            for s in pipeline.source_from.all()
+        ]
+        execution.stdout += f'Dataset table not found for {" or ".join(sources_from)}'
+        execution.status = "CRITICAL"
+    except Exception as e:
+        execution.log_exception(e)
+        execution.status = "CRITICAL"
+
+    execution.ended_at = timezone.now()
+    execution.save()
+
+    pipeline.status = execution.status
+    pipeline.save()
+
+
+@shared_task(bind=True, base=BaseTaskWithRetry)
+def async_run_stream(self, execution_id):
+    execution = PipelineExecution.objects.filter(id=execution_id).first()
+    if execution is None:
+        raise Exception(f"Execution {execution_id} not found")
+
+    run_stream(execution)
+
+    self.log_time_and_memory()
+    return True
+
+
+@shared_task(bind=True, base=BaseTaskWithRetry)
+def async_flush_stream(self, pipeline_id):
+    """Run all the stream events accumulated by the pipeline micro-batch as one execution"""
+    from .actions import (
+        pop_stream_events,
+        count_stream_events,
+        schedule_stream_flush,
+        clear_stream_flush,
+    )
+
+    pipeline = Pipeline.objects.filter(id=pipeline_id).first()
+    if pipeline is None:
+        raise Exception(f"Pipeline {pipeline_id} not found")
+
+    # the events pushed from now on can schedule another flush
+    clear_stream_flush(pipeline)
+    events = pop_stream_events(pipeline)
+    if len(events) == 0:
+        return True
+
+    execution = PipelineExecution(
+        pipeline=pipeline, incoming_stream=events, stream_batch=True
+    )
+    execution.started_at = timezone.now()
+    execution.save()
+    run_stream(execution)
+
+    # events that arrived while this batch was running
+    if count_stream_events(pipeline) > 0:
+        schedule_stream_flush(pipeline)
+
+    self.log_time_and_memory()
+    return True
+
+
 @shared_task(bind=True, base=BaseTaskWithRetry)
 def async_backup_buffer(self, execution_id, position=0):
     execution = PipelineExecution.objects.filter(id=execution_id).first()
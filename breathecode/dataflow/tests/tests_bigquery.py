@@ -0,0 +1,95 @@
+import datetime
+import pandas as pd
+from unittest import TestCase
+from unittest.mock import MagicMock
+from google.cloud import bigquery
+from breathecode.services.google_cloud.bigquery import (BigQuery, bigquery_column_name, bigquery_type,
+                                                        stringify_columns)
+
+
+def bigquery_mock(schema=None):
+    db = BigQuery.__new__(BigQuery)
+    db.dataset = 'ds'
+    db.client = MagicMock()
+    db.client.get_table.return_value.schema = schema or []
+    return db
+
+
+class BigQuerySchemaTestCase(TestCase):
+
+    def test_bigquery_column_name(self):
+        self.assertEqual(bigquery_column_name('full name'), 'full_name')
+        self.assertEqual(bigquery_column_name('e-mail'), 'e_mail')
+        self.assertEqual(bigquery_column_name('2fa'), '_2fa')
+        self.assertEqual(bigquery_column_name('created_at'), 'created_at')
+
+    def test_bigquery_type(self):
+        df = pd.DataFrame({
+            'active': [True, False],
+            'id': [1, 2],
+            'nullable_id': pd.array([1, None], dtype='Int64'),
+            'score': [1.5, None],
+            'created_at': pd.to_datetime(['2022-01-01', '2022-02-01']),
+            'updated_at': pd.to_datetime(['2022-01-01', '2022-02-01']).tz_localize('UTC'),
+            'birthday': [datetime.date(2000, 1, 1), None],
+            'name': ['a', None],
+            'mixed': [1, 'a'],
+        })
+
+        types = {column: bigquery_type(df[column]) for column in df.columns}
+        self.assertEqual(
+            types, {
+                'active': 'BOOL',
+                'id': 'INT64',
+                'nullable_id': 'INT64',
+                'score': 'FLOAT64',
+                'created_at': 'DATETIME',
+                'updated_at': 'TIMESTAMP',
+                'birthday': 'DATE',
+                'name': 'STRING',
+                'mixed': 'STRING',
+            })
+
+    def test_get_schema__existing_columns_keep_their_type(self):
+        db = bigquery_mock([bigquery.SchemaField('id', 'STRING')])
+        df = pd.DataFrame({'id': [1], 'score': [1.5]})
+
+        schema = db.get_schema(df, 'students')
+
+        self.assertEqual([(x.name, x.field_type) for x in schema], [('id', 'STRING'), ('score', 'FLOAT64')])
+
+    def test_stringify_columns__only_string_columns(self):
+        df = pd.DataFrame({'mixed': [1, 'a', None], 'id': [1, 2, 3]})
+        schema = [bigquery.SchemaField('mixed', 'STRING'), bigquery.SchemaField('id', 'INT64')]
+
+        df = stringify_columns(df, schema)
+
+        self.assertEqual(df['mixed'].tolist(), ['1', 'a', None])
+        self.assertEqual(df['id'].tolist(), [1, 2, 3])
+
+    def test_save_dataframe_to_table__replace_uses_the_dataframe_types(self):
+        db = bigquery_mock([bigquery.SchemaField('id', 'STRING')])
+
+        db.save_dataframe_to_table(pd.DataFrame({'id': [1], 'full name': ['a']}), 'students', replace=True)
+
+        df, _ = db.client.load_table_from_dataframe.call_args[0]
+        job_config = db.client.load_table_from_dataframe.call_args[1]['job_config']
+        self.assertEqual(list(df.columns), ['id', 'full_name'])
+        self.assertEqual([(x.name, x.field_type) for x in job_config.schema], [('id', 'INT64'),
+                                                                                ('full_name', 'STRING')])
+        self.assertEqual(job_config.source_format, 'PARQUET')
+        self.assertEqual(job_config.write_disposition, 'WRITE_TRUNCATE')
+        db.client.get_table.assert_not_called()
+
+    def test_save_dataframe_to_table__append_uses_the_table_types(self):
+        db = bigquery_mock([bigquery.SchemaField('id', 'STRING')])
+
+        db.save_dataframe_to_table(pd.DataFrame({'id': [1], 'score': [1.5]}), 'students')
+
+        df, _ = db.client.load_table_from_dataframe.call_args[0]
+        job_config = db.client.load_table_from_dataframe.call_args[1]['job_config']
+        self.assertEqual(df['id'].tolist(), ['1'])
+        self.assertEqual([(x.name, x.field_type) for x in job_config.schema], [('id', 'STRING'),
+                                                                                ('score', 'FLOAT64')])
+        self.assertEqual(job_config.write_disposition, 'WRITE_APPEND')
+        self.assertEqual(job_config.schema_update_options, ['ALLOW_FIELD_ADDITION'])
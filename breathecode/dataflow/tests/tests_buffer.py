@@ -0,0 +1,182 @@
+import os
+import shutil
+import tempfile
+import pandas as pd
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from breathecode.dataflow.models import Pipeline, PipelineExecution
+from breathecode.dataflow.utils import (iter_buffer_csv, write_buffer, write_buffer_chunks, read_buffer,
+                                        compress_buffer, file_hash, PARQUET, ARROW, CSV)
+
+ROWS = 25000
+
+
+class BufferTestCase(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.df = pd.DataFrame({'id': range(ROWS), 'name': ['x'] * ROWS, 'score': 1.5})
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_write_buffer__keeps_the_types(self):
+        df = pd.DataFrame({
+            'id': [1, 2],
+            'score': [1.5, None],
+            'active': [True, False],
+            'created_at': pd.to_datetime(['2022-01-01', '2022-02-01']),
+            'name': ['a', None],
+        })
+        for buffer_format in [PARQUET, ARROW]:
+            path = os.path.join(self.path, f'buffer.{buffer_format}')
+            write_buffer(df, path, buffer_format)
+
+            pd.testing.assert_frame_equal(read_buffer(path, buffer_format), df, check_dtype=True)
+
+    def test_write_buffer__mixed_types_as_strings(self):
+        df = pd.DataFrame({'id': [1, 2], 'value': [1, 'a']})
+        for buffer_format in [PARQUET, ARROW]:
+            path = os.path.join(self.path, f'buffer.{buffer_format}')
+            write_buffer(df, path, buffer_format)
+
+            self.assertEqual(read_buffer(path, buffer_format)['value'].tolist(), ['1', 'a'], buffer_format)
+
+    def test_write_buffer_chunks__types_of_every_chunk(self):
+        chunks = [
+            pd.DataFrame({
+                'id': [1, 2],
+                'updated_at': [None, None],
+                'score': [1, 2]
+            }),
+            pd.DataFrame({
+                'id': [3],
+                'updated_at': pd.to_datetime(['2022-01-01']),
+                'score': [2.5]
+            }),
+        ]
+        for buffer_format in [PARQUET, ARROW]:
+            path = os.path.join(self.path, f'buffer.{buffer_format}')
+            write_buffer_chunks(iter(chunks), path, buffer_format)
+            df = read_buffer(path, buffer_format)
+
+            self.assertTrue(pd.api.types.is_datetime64_any_dtype(df['updated_at']), buffer_format)
+            self.assertEqual(df['score'].tolist(), [1.0, 2.0, 2.5], buffer_format)
+            self.assertEqual(os.listdir(self.path), [f'buffer.{buffer_format}'], buffer_format)
+            os.remove(path)
+
+    def test_write_buffer_chunks__incompatible_types_as_strings(self):
+        chunks = [pd.DataFrame({'value': [1, 2]}), pd.DataFrame({'value': ['a']})]
+        for buffer_format in [PARQUET, ARROW]:
+            path = os.path.join(self.path, f'buffer.{buffer_format}')
+            write_buffer_chunks(iter(chunks), path, buffer_format)
+
+            self.assertEqual(read_buffer(path, buffer_format)['value'].tolist(), ['1', '2', 'a'], buffer_format)
+
+    def write_buffers(self):
+        """The same rows in chunks of 4000 rows for every buffer format and the csv backup"""
+        paths = {}
+        chunks = [self.df.iloc[i:i + 4000] for i in range(0, ROWS, 4000)]
+        for buffer_format in [PARQUET, ARROW, CSV]:
+            paths[buffer_format] = os.path.join(self.path, f'buffer.{buffer_format}')
+            write_buffer_chunks(iter(chunks), paths[buffer_format], buffer_format)
+
+        paths['csv.gz'] = paths[CSV] + '.gz'
+        compress_buffer(paths[CSV], CSV, paths['csv.gz'])
+        return paths
+
+    def read_csv(self, stream):
+        return pd.read_csv(StringIO(''.join(stream)))
+
+    def test_iter_buffer_csv__offset_and_rows(self):
+        for buffer_format, path in self.write_buffers().items():
+            df = self.read_csv(iter_buffer_csv(path, buffer_format, offset=9100, rows=7000))
+
+            self.assertEqual(len(df), 7000, buffer_format)
+            self.assertEqual(df['id'].iloc[0], 9100, buffer_format)
+            self.assertEqual(df['id'].iloc[-1], 16099, buffer_format)
+            self.assertEqual(df.columns.tolist(), ['id', 'name', 'score'], buffer_format)
+
+    def test_iter_buffer_csv__all_rows_and_columns(self):
+        for buffer_format, path in self.write_buffers().items():
+            df = self.read_csv(iter_buffer_csv(path, buffer_format, columns=['id', 'score']))
+
+            self.assertEqual(len(df), ROWS, buffer_format)
+            self.assertEqual(df.columns.tolist(), ['id', 'score'], buffer_format)
+
+    def test_iter_buffer_csv__offset_after_the_end(self):
+        for buffer_format, path in self.write_buffers().items():
+            content = ''.join(iter_buffer_csv(path, buffer_format, offset=ROWS + 10, rows=5, columns=['id']))
+
+            self.assertEqual(content, 'id\n', buffer_format)
+
+    def test_iter_buffer_csv__column_not_found(self):
+        for buffer_format, path in self.write_buffers().items():
+            with self.assertRaises(Exception, msg=buffer_format):
+                # it must fail before the first row is read
+                iter_buffer_csv(path, buffer_format, columns=['nope'])
+
+    def test_iter_buffer_csv__negative_offset(self):
+        path = os.path.join(self.path, 'buffer.csv')
+        write_buffer(self.df, path, CSV)
+
+        with self.assertRaisesRegex(Exception, "can't be negative"):
+            iter_buffer_csv(path, CSV, offset=-1)
+
+
+class BackupBufferTestCase(TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.path = tempfile.mkdtemp()
+        os.chdir(self.path)
+        os.mkdir('buffer')
+
+        self.execution = PipelineExecution(id=7, pipeline=Pipeline(slug='pipe', buffer_format=PARQUET))
+        write_buffer(pd.DataFrame({'id': [1, 2]}), self.execution.buffer_url(0), PARQUET)
+        self.files = {}
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.path)
+
+    def backup(self, checkpoint_hash=None, latest_hash=None):
+        hashes = {
+            self.execution.checkpoint_path(0): checkpoint_hash,
+            self.execution.latest_backup_path(): latest_hash,
+        }
+
+        def file(bucket_name, path):
+            self.files[path] = MagicMock()
+            self.files[path].blob = None if hashes[path] is None else MagicMock(metadata={'sha256': hashes[path]})
+            return self.files[path]
+
+        with patch('breathecode.services.google_cloud.storage.Storage') as storage:
+            storage.return_value.file.side_effect = file
+            self.execution.backup_buffer(0)
+
+        return self.files[self.execution.checkpoint_path(0)], self.files[self.execution.latest_backup_path()]
+
+    def test_backup_buffer__uploads_new_content(self):
+        checkpoint, latest = self.backup()
+
+        checkpoint.upload.assert_called_once()
+        self.assertEqual(checkpoint.upload.call_args[1]['metadata'],
+                         {'sha256': file_hash(self.execution.buffer_url(0))})
+        checkpoint.copy.assert_called_once_with(self.execution.latest_backup_path())
+
+    def test_backup_buffer__same_content_as_the_latest_backup(self):
+        checkpoint, latest = self.backup(latest_hash=file_hash(self.execution.buffer_url(0)))
+
+        checkpoint.upload.assert_not_called()
+        checkpoint.copy.assert_not_called()
+        latest.copy.assert_called_once_with(self.execution.checkpoint_path(0))
+
+    def test_backup_buffer__checkpoint_up_to_date(self):
+        content_hash = file_hash(self.execution.buffer_url(0))
+        checkpoint, latest = self.backup(checkpoint_hash=content_hash, latest_hash=content_hash)
+
+        checkpoint.upload.assert_not_called()
+        checkpoint.copy.assert_not_called()
+        latest.copy.assert_not_called()
@@ -0,0 +1,100 @@
+import pandas as pd
+from unittest import TestCase
+from unittest.mock import MagicMock
+from breathecode.dataflow.tasks import (run_transformation, transformation_cache_key, save_execution_output,
+                                        clear_transformations_cache)
+from breathecode.dataflow.utils import dataframe_hash
+
+
+def transformation_mock(code):
+    transformation = MagicMock()
+    transformation.id = 1
+    transformation.slug = 'clean'
+    transformation.code = code
+    transformation.get_code.return_value = code
+    transformation.peak_memory_mb = None
+    return transformation
+
+
+def execution_mock():
+    execution = MagicMock()
+    execution.incoming_stream = None
+    execution.stream_batch = False
+    execution.log = {}
+    execution.stdout = ''
+    execution.peak_memory_mb = None
+    execution.pipeline.memory_limit_mb = None
+    execution.pipeline.cache_outputs = True
+    return execution
+
+
+class OutputCacheTestCase(TestCase):
+
+    def setUp(self):
+        clear_transformations_cache()
+        self.df = pd.DataFrame({'id': [1, 2], 'name': ['a', 'b']})
+
+    def test_transformation_cache_key__code_and_inputs(self):
+        key = transformation_cache_key(transformation_mock('def run(df):\n    return df\n'), [self.df])
+
+        self.assertEqual(key, transformation_cache_key(transformation_mock('def run(df):\n    return df\n'),
+                                                       [self.df.copy()]))
+        self.assertNotEqual(
+            key, transformation_cache_key(transformation_mock('def run(df):\n    return df.head(1)\n'), [self.df]))
+        self.assertNotEqual(
+            key, transformation_cache_key(transformation_mock('def run(df):\n    return df\n'), [self.df.head(1)]))
+
+    def test_run_transformation__reuses_the_cached_output(self):
+        transformation = transformation_mock('def run(df):\n    raise Exception("it should not run")\n')
+        transformation.get_cached_output.return_value = self.df
+
+        transformation, output = run_transformation(transformation,
+                                                    execution_mock(),
+                                                    dfs=[self.df],
+                                                    checkpoint=False)
+
+        self.assertEqual(transformation.status, 'OPERATIONAL')
+        self.assertIs(output, self.df)
+        self.assertTrue(transformation.metrics['cached'])
+        transformation.save_cached_output.assert_not_called()
+
+    def test_run_transformation__saves_the_output_into_the_cache(self):
+        transformation = transformation_mock('def run(df):\n    return df.head(1)\n')
+        transformation.get_cached_output.return_value = None
+
+        transformation, output = run_transformation(transformation,
+                                                    execution_mock(),
+                                                    dfs=[self.df],
+                                                    checkpoint=False)
+
+        self.assertFalse(transformation.metrics['cached'])
+        key = transformation_cache_key(transformation, [self.df])
+        transformation.get_cached_output.assert_called_once_with(key)
+        transformation.save_cached_output.assert_called_once_with(key, output)
+
+    def test_save_execution_output__unchanged_output_is_not_written(self):
+        execution = execution_mock()
+        pipeline = execution.pipeline
+        pipeline.replace_destination_table = True
+        pipeline.merge_destination_table = False
+        pipeline.last_output_hash = dataframe_hash(self.df)
+        pipeline.downstream.exists.return_value = False
+
+        save_execution_output(execution, self.df.copy())
+
+        pipeline.source_to.get_source.return_value.save_dataframe_to_table.assert_not_called()
+        self.assertIn('The output did not change since the last execution', execution.stdout)
+        self.assertEqual(execution.status, 'OPERATIONAL')
+
+    def test_save_execution_output__changed_output_is_written(self):
+        execution = execution_mock()
+        pipeline = execution.pipeline
+        pipeline.replace_destination_table = True
+        pipeline.merge_destination_table = False
+        pipeline.last_output_hash = dataframe_hash(self.df.head(1))
+        pipeline.downstream.exists.return_value = False
+
+        save_execution_output(execution, self.df)
+
+        pipeline.source_to.get_source.return_value.save_dataframe_to_table.assert_called_once()
+        self.assertEqual(pipeline.last_output_hash, dataframe_hash(self.df))
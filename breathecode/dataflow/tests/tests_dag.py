@@ -0,0 +1,150 @@
+from unittest import TestCase
+from breathecode.dataflow.models import Project, get_dag
+from breathecode.dataflow.tasks import buffer_position, dag_ready_nodes, dag_descendants
+
+SOURCES = ['students', 'cohorts']
+
+
+def graph_pipe():
+    return {
+        'sources': SOURCES,
+        'transformations': ['clean_students', 'clean_cohorts', 'join', 'report'],
+        'dag': {
+            'clean_students': ['students'],
+            'clean_cohorts': ['cohorts'],
+            'join': ['clean_students', 'clean_cohorts'],
+            'report': ['join'],
+        },
+    }
+
+
+class GetDagTestCase(TestCase):
+
+    def test_get_dag__without_inputs__linear(self):
+        dag = get_dag(SOURCES, ['a', 'b', 'c'], {})
+
+        self.assertEqual(dag, {'a': SOURCES, 'b': ['a'], 'c': ['b']})
+
+    def test_get_dag__with_inputs(self):
+        dag = get_dag(SOURCES, ['a', 'b', 'c'], {'a': ['students'], 'b': ['cohorts'], 'c': ['a', 'b']})
+
+        self.assertEqual(dag, {'a': ['students'], 'b': ['cohorts'], 'c': ['a', 'b']})
+
+    def test_get_dag__input_not_declared_before(self):
+        with self.assertRaisesRegex(Exception, 'must be a source or a previous transformation'):
+            get_dag(SOURCES, ['a', 'b'], {'a': ['b']})
+
+    def test_get_dag__slug_of_a_source(self):
+        with self.assertRaisesRegex(Exception, 'same slug than a pipeline source'):
+            get_dag(SOURCES, ['students'], {})
+
+    def test_get_dag__more_than_one_output(self):
+        with self.assertRaisesRegex(Exception, 'single output, found a, b'):
+            get_dag(SOURCES, ['a', 'b'], {'a': ['students'], 'b': ['cohorts']})
+
+
+class GetConfigTestCase(TestCase):
+
+    def test_get_config__sources_and_transformations_as_strings(self):
+        project = Project(config={
+            'pipelines': [{
+                'slug': 'students',
+                'sources': ['students'],
+                'transformations': ['clean.py', 'report.py'],
+            }]
+        })
+
+        pipe = project.get_config('students')
+
+        self.assertEqual(pipe['sources'], ['students'])
+        self.assertEqual(pipe['transformations'], ['clean', 'report'])
+        self.assertEqual(pipe['source_settings'], {})
+        self.assertTrue('dag' not in pipe)
+
+    def test_get_config__sources_and_transformations_as_dictionaries(self):
+        project = Project(config={
+            'pipelines': [{
+                'slug': 'graph',
+                'sources': [{
+                    'slug': 'students',
+                    'columns': ['id', 'cohort_id'],
+                    'filter': 'id > 10'
+                }, 'cohorts'],
+                'transformations': [
+                    {
+                        'slug': 'clean_students.py',
+                        'inputs': ['students']
+                    },
+                    {
+                        'slug': 'join.py',
+                        'inputs': ['clean_students.py', 'cohorts']
+                    },
+                    'report.py',
+                ],
+            }]
+        })
+
+        pipe = project.get_config('graph')
+
+        self.assertEqual(pipe['sources'], ['students', 'cohorts'])
+        self.assertEqual(pipe['source_settings'],
+                         {'students': {
+                             'columns': ['id', 'cohort_id'],
+                             'filter': 'id > 10'
+                         }})
+        self.assertEqual(pipe['transformations'], ['clean_students', 'join', 'report'])
+        self.assertEqual(pipe['dag'], {
+            'clean_students': ['students'],
+            'join': ['clean_students', 'cohorts'],
+            'report': ['join'],
+        })
+
+    def test_get_config__pipeline_not_found(self):
+        project = Project(config={'pipelines': []})
+
+        with self.assertRaisesRegex(Exception, 'Pipeline nope does not exist'):
+            project.get_config('nope')
+
+    def test_get_config__inputs_not_a_list(self):
+        project = Project(config={
+            'pipelines': [{
+                'slug': 'graph',
+                'sources': ['students'],
+                'transformations': [{
+                    'slug': 'clean.py',
+                    'inputs': 'students'
+                }],
+            }]
+        })
+
+        with self.assertRaisesRegex(Exception, 'inputs property must be a list'):
+            project.get_config('graph')
+
+
+class DagTasksTestCase(TestCase):
+
+    def test_buffer_position(self):
+        pipe = graph_pipe()
+
+        self.assertEqual(buffer_position(pipe, 'students'), 0)
+        self.assertEqual(buffer_position(pipe, 'cohorts'), 1)
+        self.assertEqual(buffer_position(pipe, 'clean_students'), 2)
+        self.assertEqual(buffer_position(pipe, 'report'), 5)
+
+    def test_dag_ready_nodes__only_sources(self):
+        pipe = graph_pipe()
+
+        self.assertEqual(dag_ready_nodes(pipe, completed=[], started=[]), ['clean_students', 'clean_cohorts'])
+
+    def test_dag_ready_nodes__waits_for_every_input(self):
+        pipe = graph_pipe()
+        started = ['clean_students', 'clean_cohorts']
+
+        self.assertEqual(dag_ready_nodes(pipe, ['clean_students'], started), [])
+        self.assertEqual(dag_ready_nodes(pipe, ['clean_students', 'clean_cohorts'], started), ['join'])
+
+    def test_dag_descendants(self):
+        pipe = graph_pipe()
+
+        self.assertEqual(dag_descendants(pipe, 'clean_cohorts'), ['clean_cohorts', 'join', 'report'])
+        self.assertEqual(dag_descendants(pipe, 'report'), ['report'])
@@ -0,0 +1,111 @@
+import pandas as pd
+from unittest import TestCase
+from unittest.mock import MagicMock
+from breathecode.dataflow.utils import HerokuDB
+
+
+class HerokuQueryTestCase(TestCase):
+
+    def setUp(self):
+        # get_query does not use the connection
+        self.db = HerokuDB.__new__(HerokuDB)
+
+    def test_get_query__table(self):
+        self.assertEqual(self.db.get_query('students'), ('SELECT * FROM students', None))
+
+    def test_get_query__columns_and_where(self):
+        query, params = self.db.get_query('students', columns=['id', 'email'], where="status = 'ACTIVE'")
+
+        self.assertEqual(query, "SELECT id, email FROM (SELECT * FROM students) AS source WHERE (status = 'ACTIVE')")
+        self.assertEqual(params, None)
+
+    def test_get_query__watermark(self):
+        query, params = self.db.get_query('SELECT * FROM students WHERE email LIKE \'%@4geeks.com\'',
+                                          watermark_column='id',
+                                          watermark={
+                                              'value': 10,
+                                              'type': 'INT64'
+                                          })
+
+        self.assertEqual(
+            query, 'SELECT * FROM (SELECT * FROM students WHERE email LIKE \'%%@4geeks.com\') AS source '
+            'WHERE source.id > %(watermark)s')
+        self.assertEqual(params, {'watermark': 10})
+
+
+class HerokuSaveTestCase(TestCase):
+
+    def setUp(self):
+        self.db = HerokuDB.__new__(HerokuDB)
+        self.db.connection = MagicMock()
+        self.cursor = self.db.connection.cursor.return_value.__enter__.return_value
+        self.df = pd.DataFrame({'id': [1, 2], 'score': [1.0, None], 'name': ['a', 'b,c']})
+
+    def queries(self):
+        return [x[0][0] for x in self.cursor.execute.call_args_list]
+
+    def test_copy_dataframe__csv_without_floats_for_integers(self):
+        self.db.copy_dataframe(self.cursor, pd.DataFrame({'id': [1.0, None], 'name': ['a', 'b,c']}), 'students')
+
+        query, buffer = self.cursor.copy_expert.call_args[0]
+        self.assertEqual(query, 'COPY students ("id", "name") FROM STDIN WITH (FORMAT csv)')
+        self.assertEqual(buffer.getvalue(), '1,a\n,"b,c"\n')
+
+    def test_copy_dataframe__chunks(self):
+        self.db.copy_dataframe(self.cursor, pd.DataFrame({'id': range(5)}), 'students', chunk_size=2)
+
+        self.assertEqual(self.cursor.copy_expert.call_count, 3)
+
+    def test_save_dataframe_to_table__replace_new_table(self):
+        self.cursor.fetchone.return_value = (None, )
+        self.db.save_dataframe_to_table(self.df, 'students', replace=True)
+
+        queries = self.queries()
+        staging = queries[1].split(' ')[5]
+        self.assertRegex(staging, r'^students_staging_[0-9a-f]{8}$')
+        self.assertEqual(queries[1:], [
+            f'CREATE TABLE IF NOT EXISTS {staging} ("id" bigint, "score" double precision, "name" text)',
+            'DROP TABLE IF EXISTS students',
+            f'ALTER TABLE {staging} RENAME TO students',
+        ])
+        self.db.connection.commit.assert_called_once()
+
+    def test_save_dataframe_to_table__replace_keeps_the_table_definition(self):
+        self.cursor.fetchone.return_value = ('students', )
+        self.cursor.description = [('name', ), ('id', ), ('score', )]
+        self.cursor.fetchall.return_value = [('reporting', 'SELECT')]
+        self.db.save_dataframe_to_table(self.df, 'public.students', replace=True)
+
+        queries = self.queries()
+        staging = queries[2].split(' ')[2]
+        self.assertRegex(staging, r'^public.students_staging_[0-9a-f]{8}$')
+        self.assertEqual(queries[2], f'CREATE TABLE {staging} (LIKE public.students INCLUDING ALL)')
+        self.assertEqual(queries[4:], [
+            f'GRANT SELECT ON {staging} TO reporting',
+            'DROP TABLE IF EXISTS public.students',
+            f'ALTER TABLE {staging} RENAME TO students',
+        ])
+
+    def test_save_dataframe_to_table__staging_names_are_unique(self):
+        self.cursor.fetchone.return_value = (None, )
+        self.db.save_dataframe_to_table(self.df, 'students', replace=True)
+        self.db.save_dataframe_to_table(self.df, 'students', replace=True)
+
+        staging = [x for x in self.queries() if x.startswith('ALTER TABLE')]
+        self.assertNotEqual(staging[0], staging[1])
+
+    def test_save_dataframe_to_table__replace_without_swap_truncates(self):
+        self.cursor.fetchone.return_value = ('students', )
+        self.cursor.description = [('id', ), ('score', ), ('name', )]
+        self.db.save_dataframe_to_table(self.df, 'students', replace=True, swap=False)
+
+        self.assertEqual(self.queries()[2:], ['TRUNCATE TABLE students'])
+        self.cursor.copy_expert.assert_called_once()
+
+    def test_save_dataframe_to_table__append(self):
+        self.db.save_dataframe_to_table(self.df, 'students')
+
+        self.assertEqual(self.queries(), [
+            'CREATE TABLE IF NOT EXISTS students ("id" bigint, "score" double precision, "name" text)',
+        ])
+        self.cursor.copy_expert.assert_called_once()
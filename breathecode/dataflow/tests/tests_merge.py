@@ -0,0 +1,107 @@
+import pandas as pd
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import MagicMock
+from breathecode.dataflow.tasks import merge_into_destination
+from breathecode.dataflow.utils import HerokuDB, RemoteCSV
+from breathecode.services.google_cloud.bigquery import BigQuery
+
+
+class MergeTestCase(TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({'id': [1, 2], 'name': ['a', 'b']})
+
+    def test_merge_into_destination__keeps_the_last_version_of_each_row(self):
+        pipeline = MagicMock()
+        pipeline.source_to.get_primary_key.return_value = ['id']
+        pipeline.destination_table_name.return_value = 'students'
+        db = MagicMock()
+
+        merge_into_destination(pipeline, db, pd.DataFrame({'id': [1, 2, 1], 'name': ['a', 'b', 'c']}))
+
+        df = db.merge_dataframe_into_table.call_args[0][0]
+        self.assertEqual(df.to_dict('records'), [{'id': 2, 'name': 'b'}, {'id': 1, 'name': 'c'}])
+        self.assertEqual(db.merge_dataframe_into_table.call_args[1]['primary_key'], ['id'])
+
+    def test_merge_into_destination__not_supported(self):
+        pipeline = MagicMock()
+        pipeline.source_to.source_type = 'sheets'
+
+        with self.assertRaisesRegex(Exception, 'does not support merge'):
+            merge_into_destination(pipeline, object(), self.df)
+
+    def test_heroku_merge__insert_on_conflict(self):
+        db = HerokuDB.__new__(HerokuDB)
+        db.connection = MagicMock()
+        cursor = db.connection.cursor.return_value.__enter__.return_value
+
+        db.merge_dataframe_into_table(self.df, 'students', primary_key=['id'])
+
+        queries = [x[0][0] for x in cursor.execute.call_args_list]
+        staging = queries[1].split(' ')[3]
+        self.assertRegex(staging, r'^dataflow_staging_[0-9a-f]{8}$')
+        self.assertEqual(queries, [
+            'CREATE TABLE IF NOT EXISTS students ("id" bigint, "name" text, PRIMARY KEY ("id"))',
+            f'CREATE TEMP TABLE {staging} (LIKE students) ON COMMIT DROP',
+            f'INSERT INTO students ("id", "name") SELECT "id", "name" FROM {staging} '
+            'ON CONFLICT ("id") DO UPDATE SET "name" = EXCLUDED."name"',
+        ])
+        cursor.copy_expert.assert_called_once()
+        db.connection.commit.assert_called_once()
+
+    def test_heroku_merge__only_primary_key_columns(self):
+        db = HerokuDB.__new__(HerokuDB)
+        db.connection = MagicMock()
+        cursor = db.connection.cursor.return_value.__enter__.return_value
+
+        db.merge_dataframe_into_table(self.df[['id']], 'students', primary_key=['id'])
+
+        self.assertTrue(cursor.execute.call_args_list[-1][0][0].endswith('ON CONFLICT ("id") DO NOTHING'))
+
+    def test_csv_merge__replaces_the_rows_with_the_same_key(self):
+        csv = RemoteCSV.__new__(RemoteCSV)
+        csv.bucket_name = 'bucket'
+        csv.datastore = MagicMock()
+        file = csv.datastore.file.return_value
+        file.download.return_value = b'id,name\n1,x\n3,z\n'
+
+        csv.merge_dataframe_into_table(self.df, 'students.csv', primary_key=['id'])
+
+        csv.datastore.file.assert_called_once_with('bucket', 'students.csv')
+        content = file.upload.call_args[0][0]
+        self.assertEqual(
+            pd.read_csv(StringIO(content)).sort_values('id').to_dict('records'), [
+                {
+                    'id': 1,
+                    'name': 'a'
+                },
+                {
+                    'id': 2,
+                    'name': 'b'
+                },
+                {
+                    'id': 3,
+                    'name': 'z'
+                },
+            ])
+
+    def test_bigquery_merge__staging_table_and_merge_statement(self):
+        db = BigQuery.__new__(BigQuery)
+        db.dataset = 'ds'
+        db.client = MagicMock()
+        db.client.get_table.return_value.schema = []
+
+        db.merge_dataframe_into_table(pd.DataFrame({'id': [1], 'full name': ['a']}), 'students', primary_key=['id'])
+
+        queries = [' '.join(x[0][0].split()) for x in db.client.query.call_args_list]
+        staging_name = queries[0].split('`')[-2]
+        self.assertRegex(staging_name, r'^ds\.students_staging_[0-9a-f]{8}$')
+        self.assertEqual(queries, [
+            f'CREATE TABLE IF NOT EXISTS `ds.students` LIKE `{staging_name}`',
+            f'MERGE `ds.students` T USING `{staging_name}` S ON T.`id` = S.`id` '
+            'WHEN MATCHED THEN UPDATE SET `full_name` = S.`full_name` '
+            'WHEN NOT MATCHED THEN INSERT (`id`, `full_name`) VALUES (S.`id`, S.`full_name`)',
+        ])
+        db.client.load_table_from_dataframe.assert_called_once()
+        db.client.delete_table.assert_called_once()
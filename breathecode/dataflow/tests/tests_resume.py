@@ -0,0 +1,115 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from breathecode.dataflow.actions import resume_execution
+from breathecode.dataflow.tasks import async_resume_execution
+
+PIPE = {'sources': ['students', 'cohorts'], 'transformations': ['clean', 'group', 'rank']}
+
+
+def source_mock(slug, watermark_column=None):
+    source = MagicMock()
+    source.slug = slug
+    source.watermark_column = watermark_column
+    return source
+
+
+def queryset_mock(items):
+    queryset = MagicMock()
+    queryset.__iter__.side_effect = lambda: iter(items)
+    queryset.none.return_value = []
+    return queryset
+
+
+def execution_mock(log, pipe=PIPE, status='CRITICAL'):
+    execution = MagicMock()
+    execution.id = 3
+    execution.status = status
+    execution.log = log
+    execution.stdout = ''
+    execution.incoming_stream = None
+    execution.pipeline.project.get_config.return_value = pipe
+
+    students, cohorts = source_mock('students'), source_mock('cohorts')
+    sources = queryset_mock([students, cohorts])
+    # the first source is excluded once there is a checkpoint
+    sources.exclude.return_value = queryset_mock([cohorts])
+    execution.pipeline.source_from.all.return_value = sources
+    return execution
+
+
+class ResumeExecutionTestCase(TestCase):
+
+    def resume(self, execution, transformation=None, restored=None):
+        # positions that can be restored from the bucket
+        restored = restored if restored is not None else [0, 1, 2, 3, 4]
+        execution.restore_buffer.side_effect = lambda position: position in restored
+
+        with patch('breathecode.dataflow.tasks.PipelineExecution') as model, \
+                patch('breathecode.dataflow.tasks.Transformation') as transformations, \
+                patch('breathecode.dataflow.tasks.extract_source', return_value=(1, None, None)) as extract, \
+                patch('breathecode.dataflow.tasks.save_execution_output') as save, \
+                patch('breathecode.dataflow.tasks.async_run_transformation') as run:
+            model.objects.filter.return_value.first.return_value = execution
+            transformations.objects.filter.return_value.order_by.return_value.values_list.return_value = [
+                'clean', 'group', 'rank'
+            ]
+            async_resume_execution(execution.id, transformation)
+
+        return extract, save, run
+
+    def test_resume__after_the_last_checkpoint(self):
+        execution = execution_mock({'completed': ['clean']})
+
+        extract, save, run = self.resume(execution)
+
+        execution.restore_buffer.assert_any_call(2)
+        extract.assert_not_called()
+        save.assert_not_called()
+        run.delay.assert_called_once_with(3, ['clean', 'group', 'rank'])
+        self.assertEqual(execution.log['completed'], ['clean'])
+
+    def test_resume__from_a_transformation(self):
+        execution = execution_mock({'completed': ['clean', 'group']})
+
+        self.resume(execution, 'group')
+
+        self.assertEqual(execution.log['completed'], ['clean'])
+        self.assertEqual(execution.log['resumed'][0]['transformation'], 'group')
+
+    def test_resume__missing_sources_are_extracted_and_uploaded(self):
+        execution = execution_mock({'completed': ['clean']})
+
+        extract, save, run = self.resume(execution, restored=[2])
+
+        extract.assert_called_once()
+        self.assertEqual(extract.call_args[0][2].slug, 'cohorts')
+        execution.backup_buffer.assert_called_once_with(1)
+        run.delay.assert_called_once()
+
+    def test_resume__missing_checkpoint(self):
+        execution = execution_mock({'completed': ['clean']})
+
+        with self.assertRaisesRegex(Exception, 'Checkpoint of transformation clean not found'):
+            self.resume(execution, restored=[])
+
+    def test_resume__only_the_destination_failed(self):
+        execution = execution_mock({'completed': ['clean', 'group', 'rank']})
+
+        extract, save, run = self.resume(execution, restored=[4])
+
+        execution.restore_buffer.assert_called_once_with(4)
+        extract.assert_not_called()
+        save.assert_called_once_with(execution)
+        run.delay.assert_not_called()
+
+    def test_resume_execution__only_failed_executions(self):
+        execution = execution_mock({}, status='OPERATIONAL')
+
+        with self.assertRaisesRegex(Exception, 'only failed or aborted executions can resume'):
+            resume_execution(execution)
+
+    def test_resume_execution__previous_output_not_saved(self):
+        execution = execution_mock({'completed': ['clean']})
+
+        with self.assertRaisesRegex(Exception, 'Transformation group output was not saved'):
+            resume_execution(execution, 'rank')
@@ -0,0 +1,89 @@
+import os
+import time
+import shutil
+import tempfile
+import pandas as pd
+from datetime import timedelta
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from django.core.cache.backends.locmem import LocMemCache
+from breathecode.dataflow.models import DataSource
+
+
+class SnapshotTestCase(TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.path = tempfile.mkdtemp()
+        os.chdir(self.path)
+        os.mkdir('buffer')
+
+        self.cache = LocMemCache('snapshots', {})
+        self.cache.clear()
+        self.source = DataSource(id=1, slug='students', table_name='students', snapshot_ttl=timedelta(minutes=30))
+        self.db = MagicMock()
+        self.db.get_dataframe_from_table.return_value = pd.DataFrame({'id': [1, 2]})
+
+        key = self.source.snapshot_key()
+        self.lock_key = f'dataflow:snapshot:1:{key}:lock'
+        self.meta_key = f'dataflow:snapshot:1:{key}'
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.path)
+
+    def get_snapshot(self, **kwargs):
+        with patch('breathecode.dataflow.models.cache', self.cache), \
+                patch.object(DataSource, 'get_source', return_value=self.db), \
+                patch.object(DataSource, 'read_chunks', return_value=None):
+            return self.source.get_snapshot(**kwargs)
+
+    def test_get_snapshot__downloads_and_releases_the_lock(self):
+        path = self.get_snapshot()
+
+        pd.testing.assert_frame_equal(pd.read_parquet(path), pd.DataFrame({'id': [1, 2]}))
+        self.assertIsNone(self.cache.get(self.lock_key))
+        self.assertIsNotNone(self.cache.get(self.meta_key))
+
+    def test_get_snapshot__reuses_a_fresh_snapshot(self):
+        self.get_snapshot()
+        self.get_snapshot()
+
+        self.assertEqual(self.db.get_dataframe_from_table.call_count, 1)
+
+    def test_get_snapshot__waits_for_the_worker_that_holds_the_lock(self):
+        self.cache.add(self.lock_key, True)
+
+        def sleep(seconds):
+            # the other worker died and its lock expired
+            self.cache.delete(self.lock_key)
+
+        with patch('breathecode.dataflow.models.time.sleep', side_effect=sleep) as mock:
+            self.get_snapshot()
+
+        mock.assert_called_once()
+        self.assertEqual(self.db.get_dataframe_from_table.call_count, 1)
+
+    def test_get_snapshot__the_lock_is_refreshed_while_downloading(self):
+        locked = []
+
+        def download(*args, **kwargs):
+            time.sleep(0.3)
+            locked.append(self.cache.get(self.lock_key))
+            return pd.DataFrame({'id': [1, 2]})
+
+        self.db.get_dataframe_from_table.side_effect = download
+        with patch('breathecode.dataflow.models.SNAPSHOT_LOCK_TIMEOUT', 0.15):
+            self.get_snapshot()
+
+        self.assertEqual(locked, [True])
+
+    def test_get_snapshot__stale_snapshot_is_returned_while_it_refreshes(self):
+        path = self.get_snapshot()
+        self.cache.delete(self.meta_key)
+
+        with patch.object(DataSource, 'refresh_snapshot') as refresh:
+            self.assertEqual(self.get_snapshot(stale=True), path)
+
+        refresh.assert_called_once()
+        self.assertEqual(self.db.get_dataframe_from_table.call_count, 1)
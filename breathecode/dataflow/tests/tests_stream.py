@@ -0,0 +1,92 @@
+import pandas as pd
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from breathecode.dataflow.tasks import run_transformation, clear_transformations_cache
+from breathecode.dataflow.actions import push_stream_event
+
+
+def transformation_mock(id, slug, code):
+    transformation = MagicMock()
+    transformation.id = id
+    transformation.slug = slug
+    transformation.code = code
+    transformation.get_code.return_value = code
+    transformation.peak_memory_mb = None
+    return transformation
+
+
+def stream_execution_mock(events):
+    execution = MagicMock()
+    execution.incoming_stream = events
+    execution.stream_batch = True
+    execution.log = {}
+    execution.peak_memory_mb = None
+    execution.pipeline.memory_limit_mb = None
+    execution.pipeline.cache_outputs = False
+    return execution
+
+
+class StreamBatchTestCase(TestCase):
+
+    def setUp(self):
+        clear_transformations_cache()
+
+    def test_stream_batch__two_steps__one_row_per_event(self):
+        events = [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}, {'id': 3, 'name': 'c'}]
+        execution = stream_execution_mock(events)
+
+        first = transformation_mock(1, 'parse', 'def run(stream):\n    return pd.DataFrame([stream])\n')
+        second = transformation_mock(
+            2, 'clean', 'def run(df, stream):\n    df["name"] = df["name"].str.upper()\n    return df\n')
+
+        first, output = run_transformation(first, execution, dfs=[], checkpoint=False, first_step=True)
+        self.assertEqual(first.status, 'OPERATIONAL')
+        self.assertEqual(output['id'].tolist(), [1, 2, 3])
+
+        second, output = run_transformation(second, execution, dfs=[output], checkpoint=False, first_step=False)
+        self.assertEqual(second.status, 'OPERATIONAL')
+        self.assertEqual(output['id'].tolist(), [1, 2, 3])
+        self.assertEqual(output['name'].tolist(), ['A', 'B', 'C'])
+
+    def test_stream_batch__next_steps_receive_the_whole_batch(self):
+        events = [{'id': 1}, {'id': 2}]
+        execution = stream_execution_mock(events)
+
+        transformation = transformation_mock(
+            3, 'count', 'def run(df, stream):\n    return df.assign(events=len(stream))\n')
+
+        transformation, output = run_transformation(transformation,
+                                                    execution,
+                                                    dfs=[pd.DataFrame({'id': [1, 2]})],
+                                                    checkpoint=False,
+                                                    first_step=False)
+
+        self.assertEqual(transformation.status, 'OPERATIONAL')
+        self.assertEqual(output['events'].tolist(), [2, 2])
+
+
+class PushStreamEventTestCase(TestCase):
+
+    def push(self, lengths, flag=True, batch_size=3):
+        pipeline = MagicMock(id=1, stream_batch_size=batch_size, stream_batch_wait_ms=2000)
+        redis = MagicMock()
+        redis.rpush.side_effect = lengths
+        redis.set.return_value = flag
+        with patch('breathecode.dataflow.actions.get_redis_connection', return_value=redis), \
+                patch('breathecode.dataflow.actions.async_flush_stream') as flush:
+            for _ in lengths:
+                push_stream_event(pipeline, {'id': 1})
+        return flush
+
+    def test_push_stream_event__one_flush_per_full_batch(self):
+        flush = self.push([3, 4, 5, 6, 7])
+        self.assertEqual(flush.delay.call_count, 2)
+
+    def test_push_stream_event__first_event_schedules_a_flush(self):
+        flush = self.push([1, 2])
+        flush.delay.assert_not_called()
+        flush.apply_async.assert_called_once_with(args=(1, ), countdown=2.0)
+
+    def test_push_stream_event__flush_already_scheduled(self):
+        flush = self.push([1], flag=False)
+        flush.apply_async.assert_not_called()
@@ -0,0 +1,42 @@
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from breathecode.dataflow.utils import MemoryWatchdog, MemoryLimitExceeded
+
+MB = 1024**2
+
+
+def process_mock(rss):
+    process = MagicMock()
+    process.memory_info.return_value.rss = rss
+    return process
+
+
+class MemoryWatchdogTestCase(TestCase):
+
+    def run_block(self, watchdog, process):
+        with watchdog:
+            # the worker already had 2GB, the block adds 50MB
+            process.memory_info.return_value.rss = 2048 * MB + 50 * MB
+            for _ in range(100):
+                time.sleep(0.01)
+
+    def test_watchdog__memory_of_the_worker_before_the_block_is_not_counted(self):
+        process = process_mock(2048 * MB)
+        with patch('breathecode.dataflow.utils.psutil.Process', return_value=process):
+            watchdog = MemoryWatchdog(limit_mb=100, interval=0.01)
+            self.run_block(watchdog, process)
+
+        self.assertFalse(watchdog.exceeded)
+        self.assertEqual(watchdog.peak_mb, 2098)
+
+    def test_watchdog__block_over_the_limit(self):
+        process = process_mock(2048 * MB)
+        with patch('breathecode.dataflow.utils.psutil.Process', return_value=process):
+            watchdog = MemoryWatchdog(limit_mb=10, interval=0.01)
+            with self.assertRaises(MemoryLimitExceeded):
+                self.run_block(watchdog, process)
+
+        self.assertTrue(watchdog.exceeded)
+        self.assertTrue(watchdog.stop.is_set())
+        self.assertFalse(watchdog.watcher.is_alive())
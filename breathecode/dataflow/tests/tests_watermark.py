@@ -0,0 +1,59 @@
+import pandas as pd
+from unittest import TestCase
+from breathecode.dataflow.utils import get_watermark, max_watermark, filter_by_watermark
+
+
+class WatermarkTestCase(TestCase):
+
+    def test_get_watermark__int(self):
+        df = pd.DataFrame({'id': [3, 1, 2]})
+
+        self.assertEqual(get_watermark(df, 'id'), {'value': 3, 'type': 'INT64'})
+
+    def test_get_watermark__datetime(self):
+        df = pd.DataFrame({'updated_at': pd.to_datetime(['2022-01-01 10:00', '2022-03-01 08:30'])})
+
+        self.assertEqual(get_watermark(df, 'updated_at'), {'value': '2022-03-01T08:30:00', 'type': 'DATETIME'})
+
+    def test_get_watermark__timestamp(self):
+        df = pd.DataFrame({'updated_at': pd.to_datetime(['2022-01-01 10:00']).tz_localize('UTC')})
+
+        self.assertEqual(get_watermark(df, 'updated_at'), {
+            'value': '2022-01-01T10:00:00+00:00',
+            'type': 'TIMESTAMP'
+        })
+
+    def test_get_watermark__without_values(self):
+        df = pd.DataFrame({'id': pd.Series([], dtype='int64')})
+
+        self.assertEqual(get_watermark(df, 'id'), None)
+
+    def test_get_watermark__column_not_found(self):
+        with self.assertRaisesRegex(Exception, 'Watermark column id not found'):
+            get_watermark(pd.DataFrame({'name': ['a']}), 'id')
+
+    def test_max_watermark(self):
+        a = {'value': 3, 'type': 'INT64'}
+        b = {'value': 5, 'type': 'INT64'}
+
+        self.assertEqual(max_watermark(a, b), b)
+        self.assertEqual(max_watermark(None, a), a)
+        self.assertEqual(max_watermark(a, None), a)
+
+    def test_max_watermark__dates_with_different_formats(self):
+        a = {'value': '2022-03-01T08:30:00', 'type': 'DATETIME'}
+        b = {'value': '2022-02-28 23:00:00', 'type': 'DATETIME'}
+
+        self.assertEqual(max_watermark(a, b), a)
+
+    def test_filter_by_watermark(self):
+        df = pd.DataFrame({'id': [1, 2, 3, 4]})
+
+        self.assertEqual(filter_by_watermark(df, 'id', {'value': 2, 'type': 'INT64'})['id'].tolist(), [3, 4])
+        self.assertEqual(filter_by_watermark(df, 'id', None)['id'].tolist(), [1, 2, 3, 4])
+
+    def test_filter_by_watermark__dates(self):
+        df = pd.DataFrame({'id': [1, 2], 'updated_at': ['2022-01-01 10:00', '2022-03-01 08:30']})
+        watermark = {'value': '2022-02-01T00:00:00+00:00', 'type': 'TIMESTAMP'}
+
+        self.assertEqual(filter_by_watermark(df, 'updated_at', watermark)['id'].tolist(), [2])
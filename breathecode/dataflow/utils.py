@@ -1,10 +1,40 @@
 import os
 import re
+import uuid
+import json
+import gzip
+import shutil
+import hashlib
+import ctypes
+import threading
+import psutil
+from io import BytesIO, StringIO
 import psycopg2 as pg
 import pandas.io.sql as psql
 import pandas as pd
-from breathecode.services.google_cloud.storage import Storage
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
 
+PARQUET = "parquet"
+ARROW = "arrow"
+CSV = "csv"
+BUFFER_FORMATS = (
+    (PARQUET, "Parquet"),
+    (ARROW, "Arrow IPC"),
+    (CSV, "CSV"),
+)
+BUFFER_EXTENSIONS = {
+    PARQUET: "parquet",
+    ARROW: "arrow",
+    CSV: "csv",
+}
+# the backups are zstd parquet files, or gzip for csv buffers
+BACKUP_EXTENSIONS = {
+    PARQUET: "parquet",
+    ARROW: "parquet",
+    CSV: "csv.gz",
+}
 
 
 def is_select_statement(s):
@@ -12,6 +42,472 @@ def is_select_statement(s):
     return bool(pattern.search(s))
 
 
+def _stringify(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, float) and value != value:
+        return None
+    return str(value)
+
+
+def dataframe_to_arrow(df):
+    """
+    Convert a dataframe into an arrow table keeping its dtypes, object columns
+    with mixed python types (not supported by arrow) are stored as strings.
+    """
+    errors = (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError)
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except errors:
+        df = df.copy()
+        for column in df.columns[df.dtypes == object]:
+            try:
+                pa.array(df[column], from_pandas=True)
+            except errors:
+                df[column] = df[column].map(_stringify)
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def dataframe_hash(df):
+    """Hash of the columns, types and content of a dataframe"""
+    h = hashlib.sha256()
+    h.update(json.dumps([[str(c), str(t)] for c, t in df.dtypes.items()]).encode("utf-8"))
+    try:
+        rows = pd.util.hash_pandas_object(df, index=True)
+    except TypeError:
+        # columns with lists or dictionaries are not hashable
+        rows = pd.util.hash_pandas_object(df.astype(str), index=True)
+    h.update(rows.values.tobytes())
+    return h.hexdigest()
+
+
+def read_buffer(path, buffer_format=CSV):
+    if buffer_format == PARQUET:
+        return pd.read_parquet(path)
+    if buffer_format == ARROW:
+        return feather.read_table(path).to_pandas()
+    if buffer_format == CSV:
+        return pd.read_csv(path)
+
+    raise Exception(f"Invalid buffer format {buffer_format}")
+
+
+def write_buffer(df, path, buffer_format=CSV):
+    if buffer_format == CSV:
+        df.to_csv(path, index=False)
+    elif buffer_format == PARQUET:
+        pq.write_table(dataframe_to_arrow(df), path)
+    elif buffer_format == ARROW:
+        feather.write_feather(dataframe_to_arrow(df), path)
+    else:
+        raise Exception(f"Invalid buffer format {buffer_format}")
+
+
+def promote_type(current, other):
+    """Type that can hold the values of both arrow types, strings if there is none"""
+    if current == other or pa.types.is_null(other):
+        return current
+    if pa.types.is_null(current):
+        return other
+    if pa.types.is_integer(current) and pa.types.is_integer(other):
+        return pa.int64()
+    if (pa.types.is_integer(current) or pa.types.is_floating(current)) and (
+        pa.types.is_integer(other) or pa.types.is_floating(other)
+    ):
+        # e.g: an integer column that has non integral values on a later chunk
+        return pa.float64()
+    if pa.types.is_timestamp(current) and pa.types.is_timestamp(other):
+        return pa.timestamp("ns", tz=current.tz or other.tz)
+    return pa.string()
+
+
+def promote_schema(schema, other):
+    """Schema with the fields of both schemas widened to hold the values of both"""
+    fields = []
+    for field in schema:
+        index = other.get_field_index(field.name)
+        if index != -1:
+            field = field.with_type(promote_type(field.type, other.field(index).type))
+        fields.append(field)
+
+    fields += [field for field in other if schema.get_field_index(field.name) == -1]
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+def write_buffer_chunks(chunks, path, buffer_format=CSV):
+    """
+    Write an iterable of dataframes (or arrow record batches) into one buffer file, only
+    one chunk is kept in memory at a time. The chunks are spooled first to find the column
+    types that hold the values of all of them, e.g: a column without values on the first
+    chunk or an integer column that has decimals later.
+    """
+    if buffer_format == CSV:
+        header = True
+        for chunk in chunks:
+            if isinstance(chunk, pa.RecordBatch):
+                chunk = pa.Table.from_batches([chunk])
+            if isinstance(chunk, pa.Table):
+                chunk = chunk.to_pandas()
+
+            chunk.to_csv(path, index=False, header=header, mode="w" if header else "a")
+            header = False
+
+        if header:
+            write_buffer(pd.DataFrame(), path, buffer_format)
+        return
+
+    if buffer_format not in [PARQUET, ARROW]:
+        raise Exception(f"Invalid buffer format {buffer_format}")
+
+    parts = []
+    schema = None
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, pa.RecordBatch):
+                table = pa.Table.from_batches([chunk])
+            elif isinstance(chunk, pa.Table):
+                table = chunk
+            else:
+                table = dataframe_to_arrow(chunk)
+            schema = table.schema if schema is None else promote_schema(schema, table.schema)
+
+            part = f"{path}.part{len(parts)}"
+            parts.append(part)
+            with pa.ipc.new_file(part, table.schema) as spool:
+                spool.write_table(table)
+            del table
+
+        if schema is None:
+            write_buffer(pd.DataFrame(), path, buffer_format)
+            return
+
+        # columns without values on any chunk are saved as strings
+        schema = pa.schema(
+            [
+                field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                for field in schema
+            ],
+            metadata=schema.metadata,
+        )
+        if buffer_format == PARQUET:
+            writer = pq.ParquetWriter(path, schema)
+        else:
+            writer = pa.ipc.new_file(path, schema)
+
+        with writer:
+            for part in parts:
+                table = pa.ipc.open_file(pa.memory_map(part)).read_all()
+                for field in schema:
+                    if table.schema.get_field_index(field.name) == -1:
+                        table = table.append_column(
+                            field, pa.nulls(len(table), type=field.type)
+                        )
+                try:
+                    table = table.select(schema.names).cast(schema)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                    raise Exception(
+                        f"The chunks of the buffer have incompatible column types: {e}"
+                    )
+                writer.write_table(table)
+                del table
+
+    finally:
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def compress_buffer(path, buffer_format, destination):
+    """
+    Write the compressed copy of a buffer that is uploaded as backup, one record batch
+    (or csv block) at a time.
+    """
+    if buffer_format == CSV:
+        with open(path, "rb") as src, gzip.open(destination, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        return
+
+    if buffer_format == PARQUET:
+        source = pq.ParquetFile(path)
+        schema = source.schema_arrow
+        batches = source.iter_batches()
+    elif buffer_format == ARROW:
+        source = pa.ipc.open_file(path)
+        schema = source.schema
+        batches = (source.get_batch(i) for i in range(source.num_record_batches))
+    else:
+        raise Exception(f"Invalid buffer format {buffer_format}")
+
+    with pq.ParquetWriter(destination, schema, compression="zstd") as writer:
+        for batch in batches:
+            writer.write_table(pa.Table.from_batches([batch], schema=schema))
+
+
+def decompress_buffer(path, buffer_format, destination):
+    """Restore a buffer from its backup"""
+    if buffer_format == CSV:
+        with gzip.open(path, "rb") as src, open(destination, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+    elif buffer_format == PARQUET:
+        # the zstd parquet file is a valid buffer
+        shutil.move(path, destination)
+    elif buffer_format == ARROW:
+        feather.write_feather(pq.read_table(path), destination)
+    else:
+        raise Exception(f"Invalid buffer format {buffer_format}")
+
+
+def check_columns(columns, names):
+    missing = [column for column in columns or [] if column not in names]
+    if len(missing) > 0:
+        raise Exception(f"Columns not found on the buffer: {', '.join(missing)}")
+
+
+def iter_buffer_chunks(source, file_format, offset=0, columns=None, batch_size=10000):
+    """
+    Returns the number of rows that were skipped without reading them and an iterator with
+    the rest of the buffer (or backup) as dataframes of up to batch_size rows, only the
+    selected columns are read. The file format can also be csv.gz for the csv backups.
+    The file is opened and the columns are validated before returning.
+    """
+    if file_format == PARQUET:
+        source = pq.ParquetFile(source)
+        check_columns(columns, source.schema_arrow.names)
+        skipped = 0
+        row_groups = []
+        for i in range(source.num_row_groups):
+            rows = source.metadata.row_group(i).num_rows
+            if len(row_groups) == 0 and skipped + rows <= offset:
+                # the whole row group is before the offset
+                skipped += rows
+                continue
+            row_groups.append(i)
+
+        if len(row_groups) == 0:
+            return skipped, iter([])
+
+        batches = source.iter_batches(
+            batch_size=batch_size, row_groups=row_groups, columns=columns
+        )
+        return skipped, (batch.to_pandas() for batch in batches)
+
+    if file_format == ARROW:
+        source = pa.ipc.open_file(source)
+        check_columns(columns, source.schema.names)
+        skipped = 0
+        first = 0
+        while first < source.num_record_batches:
+            rows = source.get_batch(first).num_rows
+            if skipped + rows > offset:
+                break
+            skipped += rows
+            first += 1
+
+        def read_batches():
+            for i in range(first, source.num_record_batches):
+                table = pa.Table.from_batches([source.get_batch(i)])
+                yield (table.select(columns) if columns else table).to_pandas()
+
+        return skipped, read_batches()
+
+    if file_format in [CSV, "csv.gz"]:
+        chunks = pd.read_csv(
+            source,
+            chunksize=batch_size,
+            usecols=columns,
+            skiprows=range(1, offset + 1),
+            compression="gzip" if file_format == "csv.gz" else None,
+        )
+        return offset, chunks
+
+    raise Exception(f"Invalid buffer format {file_format}")
+
+
+def iter_buffer_csv(source, file_format, offset=0, rows=None, columns=None):
+    """
+    Returns an iterator with the rows of a buffer (or backup) from offset as csv text, up
+    to the given amount of rows (None for all of them), one block of rows at a time. The
+    errors opening the file or selecting its columns are raised before iterating.
+    """
+    if offset < 0 or (rows is not None and rows < 0):
+        raise Exception("The offset and the amount of rows can't be negative")
+
+    current, chunks = iter_buffer_chunks(source, file_format, offset, columns)
+
+    def read(current, rows):
+        header = True
+        for chunk in chunks:
+            start = max(offset - current, 0)
+            current += len(chunk)
+            if start >= len(chunk):
+                continue
+
+            chunk = chunk.iloc[start:]
+            if rows is not None:
+                chunk = chunk.iloc[:rows]
+                rows -= len(chunk)
+
+            yield chunk.to_csv(index=False, header=header)
+            header = False
+            if rows == 0:
+                break
+
+        if header and columns:
+            yield ",".join(columns) + "\n"
+
+    return read(current, rows)
+
+
+def get_watermark(df, column):
+    """
+    Get the highest value of the watermark column with the type needed to compare it
+    on the next incremental read, None if the dataframe has no values for it.
+    """
+    if column not in df.columns:
+        raise Exception(f"Watermark column {column} not found on the source")
+
+    value = df[column].max()
+    if pd.isna(value):
+        return None
+
+    series = df[column]
+    if pd.api.types.is_datetime64_any_dtype(series):
+        _type = "TIMESTAMP" if getattr(series.dt, "tz", None) is not None else "DATETIME"
+        return {"value": pd.Timestamp(value).isoformat(), "type": _type}
+    if pd.api.types.is_integer_dtype(series):
+        return {"value": int(value), "type": "INT64"}
+    if pd.api.types.is_float_dtype(series):
+        return {"value": float(value), "type": "FLOAT64"}
+
+    return {"value": str(value), "type": "STRING"}
+
+
+def max_watermark(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a["type"] in ["TIMESTAMP", "DATETIME"]:
+        return a if pd.Timestamp(a["value"]) >= pd.Timestamp(b["value"]) else b
+    return a if a["value"] >= b["value"] else b
+
+
+def filter_by_watermark(df, column, watermark):
+    if watermark is None:
+        return df
+
+    if watermark["type"] in ["TIMESTAMP", "DATETIME"]:
+        values = pd.to_datetime(df[column])
+        watermark_value = pd.Timestamp(watermark["value"])
+        if values.dt.tz is None and watermark_value.tz is not None:
+            watermark_value = watermark_value.tz_convert(None)
+        return df[values > watermark_value]
+
+    return df[df[column] > watermark["value"]]
+
+
+def postgres_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype):
+        return "boolean"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "bigint"
+    if pd.api.types.is_float_dtype(dtype):
+        return "double precision"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "timestamptz" if getattr(dtype, "tz", None) is not None else "timestamp"
+
+    return "text"
+
+
+def integral_floats_to_int(df):
+    """
+    Integer columns with nulls are loaded by pandas as floats, they are converted back
+    to nullable integers to avoid writing 1.0 into integer columns.
+    """
+    df = df.copy(deep=False)
+    for column in df.columns[df.dtypes == "float64"]:
+        values = df[column].dropna()
+        if len(values) > 0 and (values % 1 == 0).all():
+            df[column] = df[column].astype("Int64")
+    return df
+
+
+class MemoryLimitExceeded(Exception):
+    pass
+
+
+class MemoryWatchdog(object):
+    """
+    Keep track of the peak memory (RSS) of the process while a block of code runs, if the
+    block grows the process memory more than limit_mb a MemoryLimitExceeded exception is
+    raised inside the thread that runs the block before the worker gets killed by the system.
+    The memory that the worker already had before the block (e.g: previous tasks) is not
+    counted.
+    """
+
+    def __init__(self, limit_mb=None, interval=0.2):
+        self.limit_mb = limit_mb
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self.exceeded = False
+
+    @property
+    def peak_mb(self):
+        return round(self.peak / 1024**2, 2)
+
+    def __enter__(self):
+        self.thread_id = threading.get_ident()
+        self.start = self.process.memory_info().rss
+        self.peak = self.start
+        self.exceeded = False
+        self.stop = threading.Event()
+        self.watcher = threading.Thread(target=self.watch, daemon=True)
+        self.watcher.start()
+        return self
+
+    def watch(self):
+        while not self.stop.wait(self.interval):
+            rss = self.process.memory_info().rss
+            self.peak = max(self.peak, rss)
+            if (
+                self.limit_mb
+                and rss - self.start > self.limit_mb * 1024**2
+                and not self.exceeded
+            ):
+                self.exceeded = True
+                # it is raised on the next python instruction of the watched thread
+                ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                    ctypes.c_ulong(self.thread_id),
+                    ctypes.py_object(MemoryLimitExceeded),
+                )
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.peak = max(self.peak, self.process.memory_info().rss)
+        finally:
+            # the exception could be raised right here, the watcher has to stop anyway
+            self.stop.set()
+            self.watcher.join()
+
+        if self.exceeded and exc_type is None:
+            # the block ended before the exception was raised, it must not be raised later
+            ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                ctypes.c_ulong(self.thread_id), None
+            )
+            raise MemoryLimitExceeded()
+
+        return False
+
+
 class PipelineException(Exception):
     pipeline_slug = None
     failed_transformation = None
@@ -36,20 +532,228 @@ class HerokuDB(object):
             connection_string = os.environ.get(connection_string)
         self.connection = pg.connect(dsn=connection_string)
 
-    def get_dataframe_from_table(self, entity_name):
+    def close(self):
+        if self.connection is not None and not self.connection.closed:
+            self.connection.close()
 
+    def get_query(
+        self, entity_name, watermark_column=None, watermark=None, columns=None, where=None
+    ):
+        """Returns the query and its params"""
         if len(entity_name) > 7 and is_select_statement(entity_name[0:7]):
             query = entity_name  # its probably some SQL query instead of an entity name
-            print("Executing query: ", query)
-            df = psql.read_sql(query, self.connection)
-            # Print the number of rows and columns
-            print("Buffer obtained from Heroku: ", df.shape)
-            return df
         else:
-            print("Fetching all data from table")
-            df = psql.read_sql(f"SELECT * FROM {entity_name}", self.connection)
-            print("Buffer obtained from Heroku: ", df.shape)
-            return df
+            query = f"SELECT * FROM {entity_name}"
+
+        if columns is None and where is None and (watermark_column is None or watermark is None):
+            return query, None
+
+        conditions = []
+        params = None
+        if where is not None:
+            conditions.append(f"({where})")
+
+        if watermark_column is not None and watermark is not None:
+            # psycopg2 uses % for the params
+            query = query.replace("%", "%%")
+            conditions = [x.replace("%", "%%") for x in conditions]
+            conditions.append(f"source.{watermark_column} > %(watermark)s")
+            params = {"watermark": watermark["value"]}
+
+        selected = ", ".join(columns) if columns else "*"
+        query = f"SELECT {selected} FROM ({query}) AS source"
+        if len(conditions) > 0:
+            query += " WHERE " + " AND ".join(conditions)
+
+        return query, params
+
+    def get_dataframe_from_table(
+        self, entity_name, watermark_column=None, watermark=None, columns=None, where=None
+    ):
+
+        query, params = self.get_query(
+            entity_name, watermark_column, watermark, columns, where
+        )
+        print("Executing query: ", query)
+        df = psql.read_sql(query, self.connection, params=params)
+        # Print the number of rows and columns
+        print("Buffer obtained from Heroku: ", df.shape)
+        return df
+
+    def get_sample_dataframe(self, entity_name, rows=300, columns=None, sample=None):
+        """
+        Only the first rows of the table or query, if sample is a percentage the rows are
+        taken at random, with TABLESAMPLE for tables and filtering by random() for queries.
+        """
+        rows = int(rows)
+        if sample is not None and not is_select_statement(entity_name[0:7]):
+            selected = ", ".join(columns) if columns else "*"
+            query = f"SELECT {selected} FROM {entity_name} TABLESAMPLE SYSTEM ({float(sample)}) LIMIT {rows}"
+        else:
+            query, _ = self.get_query(entity_name, columns=columns)
+            if sample is not None:
+                query = f"SELECT * FROM ({query}) AS sample WHERE random() < {float(sample) / 100}"
+            query = f"SELECT * FROM ({query}) AS preview LIMIT {rows}"
+
+        print("Executing preview query: ", query)
+        return psql.read_sql(query, self.connection)
+
+    def iter_dataframes_from_table(
+        self,
+        entity_name,
+        chunk_size=50000,
+        watermark_column=None,
+        watermark=None,
+        columns=None,
+        where=None,
+    ):
+        """
+        Read the table using a server side cursor, yielding one dataframe every
+        chunk_size rows so the whole result set is never loaded in memory.
+        """
+        query, params = self.get_query(
+            entity_name, watermark_column, watermark, columns, where
+        )
+        print("Executing query in chunks of", chunk_size, "rows: ", query)
+
+        # named cursors are executed by postgres on the server side
+        cursor = self.connection.cursor(name=f"dataflow_{uuid.uuid4().hex}")
+        cursor.itersize = chunk_size
+        try:
+            cursor.execute(query, params)
+            rows = cursor.fetchmany(chunk_size)
+            columns = [column.name for column in cursor.description]
+            if len(rows) == 0:
+                yield pd.DataFrame(columns=columns)
+
+            while len(rows) > 0:
+                yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+                rows = cursor.fetchmany(chunk_size)
+        finally:
+            cursor.close()
+            self.connection.rollback()
+
+    def create_table_query(self, df, entity_name, primary_key=None):
+        columns = [
+            f'"{column}" {postgres_type(dtype)}' for column, dtype in df.dtypes.items()
+        ]
+        if primary_key is not None:
+            keys = ", ".join([f'"{x}"' for x in primary_key])
+            columns.append(f"PRIMARY KEY ({keys})")
+
+        return f"CREATE TABLE IF NOT EXISTS {entity_name} ({', '.join(columns)})"
+
+    def copy_dataframe(self, cursor, df, entity_name, chunk_size=100000):
+        """
+        Load the dataframe into the table with COPY FROM STDIN, it is serialized
+        as CSV in memory one chunk at a time, without temporary files.
+        """
+        columns = ", ".join([f'"{x}"' for x in df.columns])
+        query = f"COPY {entity_name} ({columns}) FROM STDIN WITH (FORMAT csv)"
+        df = integral_floats_to_int(df)
+        for start in range(0, df.shape[0], chunk_size):
+            buffer = StringIO()
+            df.iloc[start : start + chunk_size].to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+            cursor.copy_expert(query, buffer)
+
+    def table_columns(self, cursor, entity_name):
+        """Columns of the table, None if it does not exist"""
+        cursor.execute("SELECT to_regclass(%s)", (entity_name,))
+        if cursor.fetchone()[0] is None:
+            return None
+
+        cursor.execute(f"SELECT * FROM {entity_name} LIMIT 0")
+        return [column[0] for column in cursor.description]
+
+    def copy_grants(self, cursor, entity_name, staging):
+        """The privileges granted on the table are granted on the staging table too"""
+        cursor.execute(
+            "SELECT CASE WHEN acl.grantee = 0 THEN 'PUBLIC' ELSE acl.grantee::regrole::text END, "
+            "acl.privilege_type FROM pg_class, aclexplode(pg_class.relacl) AS acl "
+            "WHERE pg_class.oid = %s::regclass",
+            (entity_name,),
+        )
+        for grantee, privilege in cursor.fetchall():
+            cursor.execute(f"GRANT {privilege} ON {staging} TO {grantee}")
+
+    def save_dataframe_to_table(
+        self, df, entity_name, replace=False, quoted_newlines=False, swap=True
+    ):
+        """
+        Save the dataframe into the table using COPY. If replace is True the table
+        is created again, by default loading a staging table that is swapped with
+        the current one in the same transaction, so it is never seen empty. If the
+        dataframe has the same columns as the table, the new one keeps its types,
+        primary key, indexes and grants.
+        """
+        with self.connection.cursor() as cursor:
+            current = self.table_columns(cursor, entity_name) if replace else None
+            same_columns = current is not None and sorted(current) == sorted(df.columns)
+
+            if replace and swap:
+                # several executions could be replacing the same table
+                staging = f"{entity_name}_staging_{uuid.uuid4().hex[:8]}"
+                if same_columns:
+                    cursor.execute(
+                        f"CREATE TABLE {staging} (LIKE {entity_name} INCLUDING ALL)"
+                    )
+                    self.copy_grants(cursor, entity_name, staging)
+                else:
+                    cursor.execute(self.create_table_query(df, staging))
+                self.copy_dataframe(cursor, df, staging)
+                cursor.execute(f"DROP TABLE IF EXISTS {entity_name}")
+                table_name = entity_name.split(".")[-1]
+                cursor.execute(f"ALTER TABLE {staging} RENAME TO {table_name}")
+
+            elif replace and same_columns:
+                cursor.execute(f"TRUNCATE TABLE {entity_name}")
+                self.copy_dataframe(cursor, df, entity_name)
+
+            else:
+                if replace:
+                    cursor.execute(f"DROP TABLE IF EXISTS {entity_name}")
+                cursor.execute(self.create_table_query(df, entity_name))
+                self.copy_dataframe(cursor, df, entity_name)
+
+        self.connection.commit()
+        print(f"Saved {df.shape[0]} rows into {entity_name}")
+
+    def append_dataframe_to_table(self, df, entity_name, quoted_newlines=False):
+        return self.save_dataframe_to_table(df, entity_name, replace=False)
+
+    def stored_dataframe(self, df):
+        """The dataframe like it is read back from the table after replacing it"""
+        return integral_floats_to_int(df)
+
+    def merge_dataframe_into_table(
+        self, df, entity_name, primary_key, quoted_newlines=False
+    ):
+        """
+        Upsert the dataframe rows by the primary key, they are copied into a temporary
+        table and then inserted with ON CONFLICT, the primary key columns need a
+        unique constraint on the table.
+        """
+        columns = [f'"{x}"' for x in df.columns]
+        keys = [f'"{x}"' for x in primary_key]
+        update = ", ".join([f"{x} = EXCLUDED.{x}" for x in columns if x not in keys])
+        staging = f"dataflow_staging_{uuid.uuid4().hex[:8]}"
+
+        query = f"INSERT INTO {entity_name} ({', '.join(columns)}) "
+        query += f"SELECT {', '.join(columns)} FROM {staging} "
+        query += f"ON CONFLICT ({', '.join(keys)}) "
+        query += f"DO UPDATE SET {update}" if update else "DO NOTHING"
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(self.create_table_query(df, entity_name, primary_key))
+            cursor.execute(
+                f"CREATE TEMP TABLE {staging} (LIKE {entity_name}) ON COMMIT DROP"
+            )
+            self.copy_dataframe(cursor, df, staging)
+            cursor.execute(query)
+
+        self.connection.commit()
+        print(f"Merged {df.shape[0]} rows into {entity_name}")
 
 
 class RemoteCSV(object):
@@ -69,12 +773,57 @@ class RemoteCSV(object):
             self.connection = "gs://" + self.bucket_name + "/" + connection_string
 
         if self.datastore is None:
+            from breathecode.services.google_cloud.storage import Storage
+
             self.datastore = Storage()
 
-    def get_dataframe_from_table(self, entity_name):
-        df = pd.read_csv(self.connection)
+    def get_dataframe_from_table(
+        self, entity_name, watermark_column=None, watermark=None, columns=None, where=None
+    ):
+        """The where condition uses the pandas query syntax, e.g: age > 18 and country == 'us'"""
+        df = pd.read_csv(self.connection, usecols=columns)
+        if where is not None:
+            df = df.query(where)
+        if watermark_column is not None:
+            df = filter_by_watermark(df, watermark_column, watermark)
         return df
 
+    def iter_dataframes_from_table(
+        self,
+        entity_name,
+        chunk_size=50000,
+        watermark_column=None,
+        watermark=None,
+        columns=None,
+        where=None,
+    ):
+        """The file is downloaded and parsed chunk_size rows at a time"""
+        for df in pd.read_csv(self.connection, usecols=columns, chunksize=chunk_size):
+            if where is not None:
+                df = df.query(where)
+            if watermark_column is not None:
+                df = filter_by_watermark(df, watermark_column, watermark)
+            yield df
+
+    def get_sample_dataframe(self, entity_name, rows=300, columns=None, sample=None):
+        """
+        Only the first rows of the file, if sample is a percentage the rows are taken at
+        random while reading the file in chunks until there are enough of them.
+        """
+        if sample is None:
+            return pd.read_csv(self.connection, usecols=columns, nrows=rows)
+
+        chunks = []
+        found = 0
+        for df in pd.read_csv(self.connection, usecols=columns, chunksize=50000):
+            df = df.sample(frac=float(sample) / 100)
+            chunks.append(df)
+            found += len(df)
+            if found >= rows:
+                break
+
+        return pd.concat(chunks, ignore_index=True).head(rows)
+
     def save_dataframe_to_table(
         self, df, entity_name, replace=False, quoted_newlines=False
     ):
@@ -85,3 +834,33 @@ class RemoteCSV(object):
         print("Saving to ", self.bucket_name, without_extension + ".csv")
         file = self.datastore.file(self.bucket_name, without_extension + ".csv")
         return file.upload(df.to_csv(index=False), content_type="text/csv")
+
+    def append_dataframe_to_table(self, df, entity_name, quoted_newlines=False):
+
+        filename = os.path.basename(entity_name)
+        without_extension = os.path.splitext(filename)[0]
+
+        file = self.datastore.file(self.bucket_name, without_extension + ".csv")
+        if file.blob is not None:
+            current = pd.read_csv(BytesIO(file.download()))
+            df = pd.concat([current, df], ignore_index=True)
+
+        print("Appending to ", self.bucket_name, without_extension + ".csv")
+        return file.upload(df.to_csv(index=False), content_type="text/csv")
+
+    def merge_dataframe_into_table(
+        self, df, entity_name, primary_key, quoted_newlines=False
+    ):
+
+        filename = os.path.basename(entity_name)
+        without_extension = os.path.splitext(filename)[0]
+
+        file = self.datastore.file(self.bucket_name, without_extension + ".csv")
+        if file.blob is not None:
+            current = pd.read_csv(BytesIO(file.download()))
+            df = pd.concat([current, df], ignore_index=True).drop_duplicates(
+                subset=primary_key, keep="last"
+            )
+
+        print("Merging into ", self.bucket_name, without_extension + ".csv")
+        return file.upload(df.to_csv(index=False), content_type="text/csv")
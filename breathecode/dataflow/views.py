@@ -8,10 +8,14 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
 from .models import Pipeline, PipelineExecution, Transformation, Project
 from breathecode.utils import ValidationException
-from .serializers import ExecutionSerializer, PipelineSerializer, BigPipelineSerializer, ProjectSerializer
-from .tasks import async_run_pipeline
+from .serializers import (ExecutionSerializer, PipelineSerializer, BigPipelineSerializer, ProjectSerializer,
+                          ExecutionMetricsSerializer)
+from .tasks import async_run_pipeline, async_run_stream
+from .actions import push_stream_event, resume_execution
 import pandas as pd
 from django.http import JsonResponse
 logger = logging.getLogger(__name__)
@@ -25,11 +29,15 @@ def process_stream(request, pipeline_slug):
     if pipeline is None:
         raise ValidationException('Pipeline not found', code=404)
 
+    if pipeline.stream_batch_size > 1:
+        queued = push_stream_event(pipeline, request.data)
+        return Response({'pipeline': PipelineSerializer(pipeline).data, 'queued': queued}, status=202)
+
     execution = PipelineExecution(pipeline=pipeline, incoming_stream=request.data)
     execution.started_at = timezone.now()
     execution.save()  #save to get an id
 
-    async_run_pipeline.delay(pipeline.slug,pipeline.project.slug, execution_id=execution.id)
+    async_run_stream.delay(execution.id)
 
     return Response(ExecutionSerializer(execution).data)
 
@@ -72,20 +80,81 @@ def get_execution_buffer(request, execution_id=None):
     if execution is None:
         raise ValidationException('Pipeline Execution not found', code=404)
 
-    position = int(request.GET.get('position', 0))
-    offset = int(request.GET.get('offset', 0))
-    rows = int(request.GET.get('rows', 500))
-
     try:
+        position = request.GET.get('position', None)
+        position = int(position) if position is not None else None
+        offset = int(request.GET.get('offset', 0))
+        rows = request.GET.get('rows', '500')
+        rows = None if rows == 'all' else int(rows)
+    except ValueError:
+        raise ValidationException('position, offset and rows must be integers')
 
-        stream = execution.get_buffer_backup()
-        response = StreamingHttpResponse(stream.all(), content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="' + str(execution.pipeline.slug) + '.csv"'
-        return response
+    columns = request.GET.get('columns', None)
+    columns = columns.split(',') if columns else None
+
+    try:
+        # the file is opened and the columns validated before the response starts
+        stream = execution.iter_buffer_csv(position, offset=offset, rows=rows, columns=columns)
     except Exception as e:
         logger.error(e)
         raise ValidationException(str(e))
 
+    gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if gzip:
+        stream = (chunk.encode('utf-8') for chunk in stream)
+        stream = compress_sequence(stream)
+
+    response = StreamingHttpResponse(stream, content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="' + str(execution.pipeline.slug) + '.csv"'
+    if gzip:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding', ))
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def resume_pipeline_execution(request, execution_id):
+    """Resume a failed execution from the transformation on the body or its last checkpoint"""
+    execution = PipelineExecution.objects.filter(id=execution_id).first()
+    if execution is None:
+        raise ValidationException('Pipeline Execution not found', code=404)
+
+    try:
+        resume_execution(execution, request.data.get('transformation', None))
+    except Exception as e:
+        raise ValidationException(str(e))
+
+    return Response(ExecutionSerializer(execution).data, status=202)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_pipeline_metrics(request, pipeline_slug):
+    """Metrics of every transformation on the last executions, to chart them over time"""
+    pipeline = Pipeline.objects.filter(slug=pipeline_slug).first()
+    if pipeline is None:
+        raise ValidationException('Pipeline not found', code=404)
+
+    try:
+        limit = int(request.GET.get('limit', 50))
+    except ValueError:
+        raise ValidationException('limit must be an integer')
+
+    if limit < 1:
+        raise ValidationException('limit must be bigger than 0')
+
+    executions = PipelineExecution.objects.filter(pipeline=pipeline,
+                                                  incoming_stream__isnull=True).order_by('-id')[:limit]
+    data = ExecutionMetricsSerializer(executions, many=True).data
+
+    transformation = request.GET.get('transformation', None)
+    if transformation is not None:
+        for execution in data:
+            execution['steps'] = [s for s in execution['steps'] if s['transformation'] == transformation]
+
+    return Response(data)
+
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
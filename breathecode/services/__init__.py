@@ -1,3 +1,13 @@
 from .datetime_to_iso_format import datetime_to_iso_format
 from .eventbrite import CAMPAIGN, SOURCE, Eventbrite
-from .google_cloud import Datastore, Function, Storage
+from . import google_cloud
+
+GOOGLE_CLOUD_CLASSES = ['Datastore', 'Function', 'Storage']
+
+
+def __getattr__(name):
+    # imported on demand, see breathecode.services.google_cloud
+    if name in GOOGLE_CLOUD_CLASSES:
+        return getattr(google_cloud, name)
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -1,10 +1,32 @@
 """
 Google Cloud Service
 """
-from .datastore import *
-from .function_v1 import *
-from .function_v2 import *
-from .storage import *
-from .bigquery import *
-from .file import *
-from .credentials import *
+import importlib
+
+# the google.cloud clients are slow to import, every class is imported from its module
+# the first time it is used instead of when the package is imported
+LAZY_IMPORTS = {
+    'Datastore': 'datastore',
+    'Function': 'function_v1',
+    'FunctionV1': 'function_v1',
+    'FunctionV2': 'function_v2',
+    'Storage': 'storage',
+    'BigQuery': 'bigquery',
+    'File': 'file',
+    'resolve_credentials': 'credentials',
+}
+
+__all__ = list(LAZY_IMPORTS)
+
+
+def __getattr__(name):
+    if name not in LAZY_IMPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    value = getattr(importlib.import_module(f'.{LAZY_IMPORTS[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -3,11 +3,17 @@ import logging
 import os
 import traceback
 import re
+import uuid
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from .credentials import resolve_credentials
-from .storage import Storage
 from google.api_core import retry
 from google.cloud import bigquery
+from google.cloud.exceptions import NotFound
+import pandas as pd
+import pyarrow as pa
 import pytz
 
 logger = logging.getLogger(__name__)
@@ -24,6 +30,60 @@ def is_limit_statement(s):
     pattern = re.compile(r'\bLIMIT\b', re.IGNORECASE)
     return bool(pattern.search(s))
 
+def is_order_by_statement(s):
+    pattern = re.compile(r'\bORDER\s+BY\b', re.IGNORECASE)
+    return bool(pattern.search(s))
+
+def bigquery_column_name(name):
+    """BigQuery columns only accept letters, numbers and underscores, like autodetect does"""
+    name = re.sub(r'[^0-9a-zA-Z_]', '_', str(name))
+    if re.match(r'^[0-9]', name):
+        name = '_' + name
+    return name
+
+
+def bigquery_dataframe(df):
+    return df.rename(columns=bigquery_column_name)
+
+
+def bigquery_type(series):
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'BOOL'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'INT64'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'FLOAT64'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'TIMESTAMP' if getattr(dtype, 'tz', None) is not None else 'DATETIME'
+
+    # object columns
+    inferred = pd.api.types.infer_dtype(series, skipna=True)
+    return {
+        'boolean': 'BOOL',
+        'integer': 'INT64',
+        'floating': 'FLOAT64',
+        'mixed-integer-float': 'FLOAT64',
+        'decimal': 'NUMERIC',
+        'date': 'DATE',
+        'datetime': 'TIMESTAMP',
+        'bytes': 'BYTES',
+    }.get(inferred, 'STRING')
+
+
+def stringify_columns(df, schema):
+    """Values of the STRING columns that are not strings yet, e.g. mixed types"""
+    df = df.copy(deep=False)
+    for field in schema:
+        if field.field_type != 'STRING':
+            continue
+
+        if pd.api.types.infer_dtype(df[field.name], skipna=True) not in ['string', 'empty']:
+            df[field.name] = df[field.name].map(lambda x: x if x is None or x != x or isinstance(x, str) else str(x))
+
+    return df
+
+
 class BigQueryError(Exception):
     '''Exception raised whenever a BigQuery error happened'''
 
@@ -69,54 +129,277 @@ class BigQuery:
         if errors != []:
             raise BigQueryError(errors)
 
-    def get_dataframe_from_table(self, entity_name):
+    def append_dataframe_to_table(self, df, entity_name, quoted_newlines=True, chunk_size=500):
+        """
+        Append the rows at the end of the table, a few rows are streamed without load jobs
+        and bigger dataframes are loaded with the types of the table.
+        """
+        if len(df) > chunk_size:
+            return self.save_dataframe_to_table(df, entity_name, replace=False)
+
+        df = bigquery_dataframe(df)
+        table = self.client.dataset(self.dataset).table(entity_name)
+        rows = json.loads(df.to_json(orient='records', date_format='iso'))
+        for start in range(0, len(rows), chunk_size):
+            errors = self.client.insert_rows_json(table,
+                                                  rows[start:start + chunk_size],
+                                                  retry=retry.Retry(deadline=30))
+            if errors != []:
+                raise BigQueryError(errors)
+
+        return table
+
+    def get_dataframe_from_table(self,
+                                 entity_name,
+                                 watermark_column=None,
+                                 watermark=None,
+                                 columns=None,
+                                 where=None):
+
+        batches = list(
+            self.iter_record_batches(entity_name,
+                                     columns=columns,
+                                     row_restriction=where,
+                                     watermark_column=watermark_column,
+                                     watermark=watermark))
+        return pa.Table.from_batches(batches).to_pandas()
 
+    def iter_dataframes_from_table(self,
+                                   entity_name,
+                                   chunk_size=None,
+                                   watermark_column=None,
+                                   watermark=None,
+                                   columns=None,
+                                   where=None):
+        """The size of each chunk is decided by the Storage Read API"""
+        for batch in self.iter_record_batches(entity_name,
+                                              columns=columns,
+                                              row_restriction=where,
+                                              watermark_column=watermark_column,
+                                              watermark=watermark):
+            yield batch.to_pandas()
+
+    def get_sample_dataframe(self, entity_name, rows=300, columns=None, sample=None):
+        """
+        Only the first rows of the table or query, tables are previewed with tabledata.list
+        (max_results) that has no query cost, if sample is a percentage the rows are taken
+        at random with TABLESAMPLE.
+        """
+        rows = int(rows)
+        selected = ', '.join([f'`{x}`' for x in columns]) if columns else '*'
         if len(entity_name) > 7 and is_select_statement(entity_name):
-        
-            if not is_limit_statement(entity_name):
-                # Append a limit clause to the SQL query
-                entity_name = f"{entity_name} LIMIT 50000"
-    
-            query_job = self.client.query(entity_name)  # SQL Query
-            df = query_job.to_dataframe()
-        else:
-            table = self.client.dataset(self.dataset).table(entity_name)
-            # Get the last 50000 rows
-            total_rows = self.client.get_table(table).num_rows
-            rows_to_skip = max(0, total_rows - 50000)
-            df = self.client.list_rows(table, start_index=rows_to_skip).to_dataframe()
-            
-        return df
+            query = f'SELECT {selected} FROM ({entity_name}) AS preview'
+            if sample is not None:
+                query += f' WHERE RAND() < {float(sample) / 100}'
+            return self.client.query(f'{query} LIMIT {rows}').to_dataframe()
 
-    def save_dataframe_to_table(self, df, entity_name, replace=False, quoted_newlines=True):
+        if sample is not None:
+            table_name = f'{self.dataset}.{entity_name}'
+            query = f'SELECT {selected} FROM `{table_name}` TABLESAMPLE SYSTEM ({float(sample)} PERCENT)'
+            return self.client.query(f'{query} LIMIT {rows}').to_dataframe()
+
+        table = self.client.get_table(self.client.dataset(self.dataset).table(entity_name))
+        selected_fields = None
+        if columns:
+            selected_fields = [field for field in table.schema if field.name in columns]
 
-        file = Storage().file(self.bucket_name, f'{entity_name}.csv')
-        file.upload(df.to_csv(index=False), content_type='text/csv')
+        return self.client.list_rows(table, max_results=rows, selected_fields=selected_fields).to_dataframe()
+
+    def get_table_to_read(self, entity_name, watermark_column=None, watermark=None):
+        """
+        Returns the table that will be read and its row restriction, queries are executed first
+        and their results table is read instead.
+        """
+        if len(entity_name) > 7 and is_select_statement(entity_name):
+            query = entity_name
+            job_config = None
+
+            if watermark_column is not None and watermark is not None:
+                value = watermark['value']
+                if watermark['type'] in ['TIMESTAMP', 'DATETIME']:
+                    value = pd.Timestamp(value).to_pydatetime()
+
+                job_config = bigquery.QueryJobConfig(query_parameters=[
+                    bigquery.ScalarQueryParameter('watermark', watermark['type'], value),
+                ])
+                query = f'SELECT * FROM ({query}) AS source WHERE source.{watermark_column} > @watermark'
+
+            query_job = self.client.query(query, job_config=job_config)  # SQL Query
+            query_job.result()
+            return query_job.destination, None
 
         table = self.client.dataset(self.dataset).table(entity_name)
+        if watermark_column is None or watermark is None:
+            return table, None
+
+        if watermark['type'] in ['INT64', 'FLOAT64']:
+            value = str(watermark['value'])
+        elif watermark['type'] in ['TIMESTAMP', 'DATETIME']:
+            value = f'CAST("{watermark["value"]}" AS {watermark["type"]})'
+        else:
+            value = json.dumps(watermark['value'])
 
-        if replace:
-            self.client.delete_table(table, not_found_ok=True)
+        return table, f'{watermark_column} > {value}'
 
-        # Define storage bucket
+    def iter_record_batches(self,
+                            entity_name,
+                            columns=None,
+                            row_restriction=None,
+                            watermark_column=None,
+                            watermark=None,
+                            max_streams=4):
+        """
+        Read the whole table (or query result) with the BigQuery Storage Read API, yielding the
+        arrow record batches of up to max_streams streams that are read in parallel. Only the
+        selected columns and the rows that match the row restriction are transferred. Queries
+        with ORDER BY are read with one stream to keep the order of their rows.
+        """
+        from google.cloud import bigquery_storage
+
+        table, watermark_restriction = self.get_table_to_read(entity_name, watermark_column, watermark)
+        restrictions = [x for x in [row_restriction, watermark_restriction] if x]
+
+        read_client = bigquery_storage.BigQueryReadClient()
+        requested_session = bigquery_storage.types.ReadSession(
+            table=f'projects/{table.project}/datasets/{table.dataset_id}/tables/{table.table_id}',
+            data_format=bigquery_storage.types.DataFormat.ARROW,
+            read_options=bigquery_storage.types.ReadSession.TableReadOptions(
+                selected_fields=columns or [],
+                row_restriction=' AND '.join([f'({x})' for x in restrictions]),
+            ),
+        )
+        if is_select_statement(entity_name) and is_order_by_statement(entity_name):
+            # the rows of the result table are sorted, only one stream keeps that order
+            max_streams = 1
+
+        session = read_client.create_read_session(parent=f'projects/{self.client.project}',
+                                                  read_session=requested_session,
+                                                  max_stream_count=max_streams)
+
+        if len(session.streams) == 0:
+            # the table is empty but its columns are still needed
+            schema = pa.ipc.read_schema(pa.py_buffer(session.arrow_schema.serialized_schema))
+            yield pa.RecordBatch.from_arrays([pa.array([], type=x.type) for x in schema], schema=schema)
+            return
+
+        batches = queue.Queue(maxsize=len(session.streams) * 2)
+        stop = threading.Event()
+
+        def read_stream(stream):
+            reader = read_client.read_rows(stream.name)
+            for page in reader.rows(session).pages:
+                batch = page.to_arrow()
+                while not stop.is_set():
+                    try:
+                        batches.put(batch, timeout=1)
+                        break
+                    except queue.Full:
+                        pass
+
+                if stop.is_set():
+                    return
+
+        executor = ThreadPoolExecutor(max_workers=len(session.streams))
+        futures = [executor.submit(read_stream, stream) for stream in session.streams]
+        try:
+            while True:
+                try:
+                    yield batches.get(timeout=0.5)
+                except queue.Empty:
+                    for future in futures:
+                        if future.done() and future.exception() is not None:
+                            raise future.exception()
+
+                    # no stream will add more batches
+                    if all([future.done() for future in futures]) and batches.empty():
+                        break
+        finally:
+            stop.set()
+            executor.shutdown(wait=True)
+
+    def get_schema(self, df, entity_name=None):
+        """
+        Explicit schema of the dataframe, used instead of autodetect. The columns that
+        already exist on the entity_name table keep their current type.
+        """
+        current = {}
+        if entity_name is not None:
+            try:
+                table = self.client.get_table(self.client.dataset(self.dataset).table(entity_name))
+                current = {field.name: field for field in table.schema}
+            except NotFound:
+                pass
+
+        return [
+            current[column] if column in current else bigquery.SchemaField(column, bigquery_type(df[column]))
+            for column in df.columns
+        ]
+
+    def load_dataframe(self, df, entity_name, schema, replace=False):
+        """Load the dataframe serialized as parquet, without intermediate files on Cloud Storage"""
+        table = self.client.dataset(self.dataset).table(entity_name)
         job_config = bigquery.LoadJobConfig(
-            autodetect=True,
-            skip_leading_rows=1,
+            schema=schema,
+            source_format=bigquery.SourceFormat.PARQUET,
             create_disposition='CREATE_IF_NEEDED',
-            allow_quoted_newlines=quoted_newlines,
-            # The source format defaults to CSV, so the line below is optional.
-            source_format=bigquery.SourceFormat.CSV,
+            write_disposition='WRITE_TRUNCATE' if replace else 'WRITE_APPEND',
         )
+        if not replace:
+            job_config.schema_update_options = [bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION]
 
-        load_job = self.client.load_table_from_uri(f'gs://{self.bucket_name}/{entity_name}.csv',
-                                                   table,
-                                                   job_config=job_config)  # Make an API request.
-
+        load_job = self.client.load_table_from_dataframe(stringify_columns(df, schema),
+                                                         table,
+                                                         job_config=job_config)  # Make an API request.
         load_job.result()
+        return table
+
+    def save_dataframe_to_table(self, df, entity_name, replace=False, quoted_newlines=True):
+
+        df = bigquery_dataframe(df)
+
+        # when replacing, the dataframe types are the source of truth
+        schema = self.get_schema(df, None if replace else entity_name)
+        table = self.load_dataframe(df, entity_name, schema, replace=replace)
 
         # table.num_rows will give you the number of rows in the table. More than 0 is good
         return table
 
+    def stored_dataframe(self, df):
+        """The dataframe like it is read back from the table after replacing it"""
+        df = bigquery_dataframe(df)
+        return stringify_columns(df, self.get_schema(df))
+
+    def merge_dataframe_into_table(self, df, entity_name, primary_key, quoted_newlines=True):
+        """Upsert the dataframe rows by the primary key, using a staging table and a MERGE statement"""
+
+        df = bigquery_dataframe(df)
+        primary_key = [bigquery_column_name(x) for x in primary_key]
+
+        # the staging table uses the types of the destination to be able to compare them
+        staging_name = f'{entity_name}_staging_{uuid.uuid4().hex[:8]}'
+        self.load_dataframe(df, staging_name, self.get_schema(df, entity_name), replace=True)
+
+        table = f'`{self.dataset}.{entity_name}`'
+        staging = f'`{self.dataset}.{staging_name}`'
+        columns = [f'`{x}`' for x in df.columns]
+        keys = [f'`{x}`' for x in primary_key]
+
+        on = ' AND '.join([f'T.{x} = S.{x}' for x in keys])
+        update = ', '.join([f'{x} = S.{x}' for x in columns if x not in keys])
+        when_matched = f'WHEN MATCHED THEN UPDATE SET {update}' if update else ''
+
+        try:
+            self.client.query(f'CREATE TABLE IF NOT EXISTS {table} LIKE {staging}').result()
+            self.client.query(f"""
+                MERGE {table} T USING {staging} S ON {on}
+                {when_matched}
+                WHEN NOT MATCHED THEN INSERT ({', '.join(columns)}) VALUES ({', '.join(['S.' + x for x in columns])})
+            """).result()
+        finally:
+            self.client.delete_table(self.client.dataset(self.dataset).table(staging_name), not_found_ok=True)
+
+        return self.client.dataset(self.dataset).table(entity_name)
+
     def success(self, event_name):
         logger.info(f'Event {event_name} streamed into BigQuery')
         logger.success({
@@ -23,9 +23,17 @@ class File:
         if self.blob:
             self.blob.delete()
 
-    def upload(self, content=None, from_filename=None, public: bool = False, content_type: str = 'text/plain') -> None:
-        """Upload Blob from Bucket"""
-        self.blob = self.bucket.blob(self.file_name)
+    def upload(self,
+               content=None,
+               from_filename=None,
+               public: bool = False,
+               content_type: str = 'text/plain',
+               chunk_size: int = None,
+               metadata: dict = None) -> None:
+        """Upload Blob from Bucket, it uses a resumable upload in chunks if chunk_size is set"""
+        self.blob = self.bucket.blob(self.file_name, chunk_size=chunk_size)
+        if metadata is not None:
+            self.blob.metadata = metadata
 
         if from_filename is not None:
             self.blob.upload_from_filename(from_filename)
@@ -58,28 +66,23 @@ class File:
         if self.blob:
             return self.blob.download_as_string()
 
-    def stream_download(self) -> str:
-        """Delete Blob from Bucket"""
-
-        class Echo:
-            """An object that implements just the write method of the file-like
-            interface.
-            """
-
-            def __init__(self):
-                self.pieces = []
-
-            def write(self, value):
-                """Write the value by returning it, instead of storing in a buffer."""
-                self.pieces.append(value.decode('latin1'))
-
-            def all(self):
-                return self.pieces
-
-        streamer = Echo()
+    def open(self, mode: str = 'rb', chunk_size: int = None):
+        """File-like object that reads (or writes) the Blob in chunks, without loading it in memory"""
         blob = self.bucket.blob(self.file_name)
-        blob.download_to_file(streamer)
-        return streamer
+        return blob.open(mode, chunk_size=chunk_size)
+
+    def stream_download(self, chunk_size: int = 1024 * 1024):
+        """Iterator with the content of the Blob, chunk_size bytes at a time"""
+        with self.open('rb', chunk_size=chunk_size) as stream:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def copy(self, file_name: str) -> None:
+        """Copy the Blob inside the Bucket, the content is not downloaded"""
+        self.bucket.copy_blob(self.bucket.blob(self.file_name), self.bucket, file_name)
 
     def rename(self, file_name: str) -> None:
         """Renames a blob."""